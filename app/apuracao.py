@@ -0,0 +1,257 @@
+import json
+import threading
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+
+# --- APURAÇÃO INCREMENTAL EM MEMÓRIA ---
+# Mantém a contagem de cada pauta em memória. É reconstruída a partir das
+# tabelas votos/votos_escolhas no startup ou na primeira consulta (cache miss)
+# e atualizada por registrar_voto logo após o commit. Cada processo (worker) tem a sua.
+
+_lock = threading.Lock()
+_apuracoes = {}
+_carregando = {}  # pauta_id -> [lista de votos registrados durante cada carga em andamento]
+_geracao_apuracoes = 0
+_consultas = 0  # chamadas a obter_apuracao*
+_cargas = 0  # pautas relidas do banco (cache miss)
+
+def contagem_vazia(pauta: models.Pauta) -> dict:
+    if pauta.tipo == "SIMPLES": return {"favor": 0, "contra": 0, "abstencao": 0}
+    candidatos = json.loads(pauta.candidatos_str) if pauta.candidatos_str else []
+    return {c: 0 for c in candidatos}
+
+class _Apuracao:
+    def __init__(self, pauta: models.Pauta):
+        self.simples = pauta.tipo == "SIMPLES"
+        self.contagem = contagem_vazia(pauta)
+        self.escolhas = {}  # usuario_id -> valor (str na SIMPLES, lista na ELEICAO), na ordem dos votos
+
+    def somar(self, usuario_id: str, valor):
+        if usuario_id in self.escolhas: return
+        self.escolhas[usuario_id] = valor
+        # SIMPLES conta uma vez e só texto; na eleição cada candidato conta uma vez por voto
+        if self.simples:
+            if isinstance(valor, str) and valor in self.contagem: self.contagem[valor] += 1
+            return
+        for c in dict.fromkeys(valor if isinstance(valor, list) else [valor]):
+            if c in self.contagem: self.contagem[c] += 1
+
+def _carregar(db: Session, pautas: list) -> dict:
+    """Reconstrói a apuração das pautas a partir de votos + votos_escolhas, numa única consulta."""
+    aps = {p.id: _Apuracao(p) for p in pautas}
+    if not aps: return aps
+    # LEFT JOIN para não perder votos sem escolha (eleição com lista vazia)
+    linhas = db.query(models.Voto.pauta_id, models.Voto.usuario_id, models.VotoEscolha.escolha)\
+        .outerjoin(models.VotoEscolha, models.VotoEscolha.voto_id == models.Voto.id)\
+        .filter(models.Voto.pauta_id.in_(list(aps)))\
+        .order_by(models.Voto.id, models.VotoEscolha.posicao)
+    votos = {}
+    for pauta_id, usuario_id, escolha in linhas:
+        valores = votos.setdefault((pauta_id, usuario_id), [])
+        if escolha is not None: valores.append(escolha)
+    for (pauta_id, usuario_id), valores in votos.items():
+        ap = aps[pauta_id]
+        # SIMPLES tem no máximo uma linha em votos_escolhas (ver VotoEscolha.linhas)
+        ap.somar(usuario_id, valores[0] if ap.simples and valores else valores)
+    return aps
+
+def contagens(db: Session, pauta_ids: list) -> dict:
+    """Contagem por escolha calculada no banco: {pauta_id: {escolha: n}}."""
+    res = {pid: {} for pid in pauta_ids}
+    if not pauta_ids: return res
+    linhas = db.query(models.VotoEscolha.pauta_id, models.VotoEscolha.escolha, func.count())\
+        .filter(models.VotoEscolha.pauta_id.in_(pauta_ids))\
+        .group_by(models.VotoEscolha.pauta_id, models.VotoEscolha.escolha)
+    for pauta_id, escolha, n in linhas: res[pauta_id][escolha] = n
+    return res
+
+# --- CARGA FORA DO LOCK ---
+# O _lock também é usado pelas rotas assíncronas no event loop: nunca fica
+# preso durante SQL. Cada carga registra uma lista em _carregando antes de
+# consultar; registrar_voto anota ali os votos que chegarem nesse meio tempo,
+# e eles são somados quando a carga entra em _apuracoes (somar é idempotente).
+# Se a apuração foi invalidada durante a consulta, o resultado não é guardado.
+
+def _comecar_carga(pauta_ids: list) -> dict:
+    # Chamada com o _lock; cada carga tem a sua lista, mesmo de uma pauta já em carga
+    pendentes = {pid: [] for pid in pauta_ids}
+    for pid, lista in pendentes.items(): _carregando.setdefault(pid, []).append(lista)
+    return pendentes
+
+def _soltar_carga(pendentes: dict):
+    # Chamada com o _lock; compara por identidade (listas vazias são iguais entre si)
+    for pid, lista in pendentes.items():
+        restantes = [l for l in _carregando.get(pid, ()) if l is not lista]
+        if restantes: _carregando[pid] = restantes
+        else: _carregando.pop(pid, None)
+
+def _concluir_carga(carregadas: dict, pendentes: dict, geracao: int) -> dict:
+    """Soma os votos que chegaram durante a carga e guarda o resultado; devolve as apurações a usar."""
+    global _cargas
+    with _lock:
+        _cargas += len(carregadas)
+        _soltar_carga(pendentes)
+        res = {}
+        for pid, ap in carregadas.items():
+            for usuario_id, valor in pendentes[pid]: ap.somar(usuario_id, valor)
+            res[pid] = _apuracoes.setdefault(pid, ap) if geracao == _geracao_apuracoes else ap
+        return res
+
+def _cancelar_carga(pendentes: dict):
+    with _lock: _soltar_carga(pendentes)
+
+def aquecer(db: Session, pautas: list):
+    """Carrega de uma vez a apuração das pautas que ainda não estão em memória."""
+    with _lock:
+        faltando = [p for p in pautas if p.id not in _apuracoes]
+        if not faltando: return
+        pendentes, geracao = _comecar_carga([p.id for p in faltando]), _geracao_apuracoes
+    try: carregadas = _carregar(db, faltando)
+    except BaseException:
+        _cancelar_carga(pendentes)
+        raise
+    _concluir_carga(carregadas, pendentes, geracao)
+
+def _resultado(ap: _Apuracao, usuario_id: str, detalhes: bool) -> dict:
+    res = {
+        "total": len(ap.escolhas),
+        "contagem": dict(ap.contagem),
+        "meu_voto": ap.escolhas.get(usuario_id) if usuario_id else None,
+    }
+    if detalhes: res["escolhas"] = list(ap.escolhas.items())
+    return res
+
+def obter_apuracao(db: Session, pauta: models.Pauta, usuario_id: str = None, detalhes: bool = False) -> dict:
+    """Retorna total, contagem e o voto de `usuario_id` (ou None) da pauta.
+
+    Com `detalhes=True` inclui também a lista (usuario_id, valor) de todos os votos.
+    """
+    global _consultas
+    with _lock:
+        _consultas += 1
+        ap = _apuracoes.get(pauta.id)
+        if ap is not None: return _resultado(ap, usuario_id, detalhes)
+        pendentes, geracao = _comecar_carga([pauta.id]), _geracao_apuracoes
+    try: carregadas = _carregar(db, [pauta])
+    except BaseException:
+        _cancelar_carga(pendentes)
+        raise
+    ap = _concluir_carga(carregadas, pendentes, geracao)[pauta.id]
+    with _lock: return _resultado(ap, usuario_id, detalhes)
+
+async def obter_apuracao_async(db: AsyncSession, pauta: models.Pauta, usuario_id: str = None, detalhes: bool = False) -> dict:
+    """obter_apuracao para rotas assíncronas (a carga roda pela sessão assíncrona)."""
+    global _consultas
+    with _lock:
+        _consultas += 1
+        ap = _apuracoes.get(pauta.id)
+        if ap is not None: return _resultado(ap, usuario_id, detalhes)
+        pendentes, geracao = _comecar_carga([pauta.id]), _geracao_apuracoes
+    try: carregadas = await db.run_sync(_carregar, [pauta])
+    except BaseException:
+        _cancelar_carga(pendentes)
+        raise
+    ap = _concluir_carga(carregadas, pendentes, geracao)[pauta.id]
+    with _lock: return _resultado(ap, usuario_id, detalhes)
+
+def votos_do_delegado(db: Session, pautas: list, usuario_id: str) -> dict:
+    """{pauta_id: valor} dos votos de `usuario_id` nas `pautas`.
+
+    Pautas com apuração em memória respondem dela; as demais saem de uma única
+    consulta só com os votos do delegado (sem carregar a apuração inteira).
+    """
+    global _consultas
+    res, faltando = {}, []
+    with _lock:
+        _consultas += 1
+        for p in pautas:
+            ap = _apuracoes.get(p.id)
+            if ap is None: faltando.append(p.id)
+            elif usuario_id in ap.escolhas: res[p.id] = ap.escolhas[usuario_id]
+    if faltando:
+        linhas = db.query(models.Voto.pauta_id, models.Voto.escolha_str)\
+            .filter(models.Voto.usuario_id == usuario_id, models.Voto.pauta_id.in_(faltando))
+        for pauta_id, escolha_str in linhas: res[pauta_id] = json.loads(escolha_str) if escolha_str else []
+    return res
+
+def voto_em_memoria(pauta_id: str, usuario_id: str):
+    """(True, valor ou None) se a apuração da pauta está em memória; (False, None) se não está."""
+    with _lock:
+        ap = _apuracoes.get(pauta_id)
+        if ap is None: return False, None
+        return True, ap.escolhas.get(usuario_id)
+
+def registrar_voto(pauta_id: str, usuario_id: str, valor):
+    with _lock:
+        ap = _apuracoes.get(pauta_id)
+        if ap is not None: ap.somar(usuario_id, valor)
+        for lista in _carregando.get(pauta_id, ()): lista.append((usuario_id, valor))
+
+def invalidar(pauta_id: str = None):
+    """Descarta a apuração de uma pauta (ou de todas); a próxima consulta relê do banco."""
+    global _geracao_apuracoes
+    with _lock:
+        if pauta_id is None: _apuracoes.clear()
+        else: _apuracoes.pop(pauta_id, None)
+        _geracao_apuracoes += 1
+    invalidar_pautas()
+
+def geracao() -> int:
+    """Muda sempre que apurações são descartadas (votos apagados, pauta editada)."""
+    return _geracao_apuracoes
+
+def estatisticas() -> dict:
+    with _lock:
+        return {"pautas": len(_apuracoes), "votos": sum(len(ap.escolhas) for ap in _apuracoes.values()),
+                "consultas": _consultas, "cargas": _cargas}
+
+# --- DADOS DA PAUTA PARA VALIDAR VOTOS ---
+# Evita reler a pauta e decodificar candidatos_str a cada voto.
+_pautas = {}
+_geracao_pautas = 0
+
+def _info_pauta(pauta: models.Pauta) -> dict:
+    return {
+        "id": pauta.id, "status": pauta.status, "tipo": pauta.tipo, "max_escolhas": pauta.max_escolhas,
+        "candidatos": frozenset(json.loads(pauta.candidatos_str)) if pauta.candidatos_str else frozenset(),
+    }
+
+def _pauta_em_cache(pauta_id: str):
+    with _lock: return _pautas.get(pauta_id), _geracao_pautas
+
+def _guardar_pauta(pauta_id: str, info: dict, geracao: int):
+    # Não guarda o que foi lido se alguma pauta mudou durante a consulta
+    with _lock:
+        if geracao == _geracao_pautas: _pautas[pauta_id] = info
+
+def dados_pauta(db: Session, pauta_id: str):
+    """Retorna {"id", "status", "tipo", "max_escolhas", "candidatos"} ou None se não existir."""
+    info, geracao = _pauta_em_cache(pauta_id)
+    if info is not None: return info
+    pauta = db.query(models.Pauta).filter(models.Pauta.id == pauta_id).first()
+    if not pauta: return None
+    info = _info_pauta(pauta)
+    _guardar_pauta(pauta_id, info, geracao)
+    return info
+
+async def dados_pauta_async(db: AsyncSession, pauta_id: str):
+    info, geracao = _pauta_em_cache(pauta_id)
+    if info is not None: return info
+    pauta = (await db.execute(select(models.Pauta).where(models.Pauta.id == pauta_id))).scalars().first()
+    if not pauta: return None
+    info = _info_pauta(pauta)
+    _guardar_pauta(pauta_id, info, geracao)
+    return info
+
+def invalidar_pautas():
+    """Descarta os dados de validação de todas as pautas (após mudança de status)."""
+    global _geracao_pautas
+    with _lock:
+        _pautas.clear()
+        _geracao_pautas += 1
+
+def carregar_abertas(db: Session):
+    """Pré-carrega as pautas abertas (chamado no startup)."""
+    aquecer(db, db.query(models.Pauta).filter(models.Pauta.status == "ABERTA").all())
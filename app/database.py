@@ -1,6 +1,9 @@
 import os
 import sys
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -19,20 +22,105 @@ if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://")
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
 # 3. Criação do Engine
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+# Perfil ajustável por variáveis de ambiente. No PostgreSQL o padrão do
+# SQLAlchemy (5+10 conexões) fica abaixo da concorrência de uma votação; no
+# SQLite fica o padrão: o threadpool, os streams, a presença e o escritor de
+# votos pegam conexões ao mesmo tempo, e sem folga uma carga lenta faria os
+# demais esperarem o pool_timeout.
+E_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5 if E_SQLITE else 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10 if E_SQLITE else 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# SQLite: WAL deixa as leituras (polls) seguirem durante a escrita de um voto
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", 64))
+
+def _opcoes_pool(url: str) -> dict:
+    if E_SQLITE and make_url(url).database in (None, "", ":memory:"): return {}  # pool de conexão única
+    if E_SQLITE: return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": DB_POOL_PRE_PING}
+
+def _pragmas_sqlite(dbapi_connection, connection_record):
+    cur = dbapi_connection.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cur.close()
+
+if E_SQLITE:
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, **_opcoes_pool(SQLALCHEMY_DATABASE_URL)
     )
+    event.listen(engine, "connect", _pragmas_sqlite)
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **_opcoes_pool(SQLALCHEMY_DATABASE_URL))
+
+def descrever_engine() -> str:
+    """Resumo das configurações efetivas, para o log de startup."""
+    pool = engine.pool
+    partes = [f"dialeto={engine.dialect.name}", f"pool={type(pool).__name__}"]
+    if isinstance(pool, QueuePool): partes.append(f"tamanho={pool.size()}+{pool._max_overflow}")
+    if not E_SQLITE: partes += [f"pre_ping={DB_POOL_PRE_PING}", f"recycle={DB_POOL_RECYCLE}s"]
+    else:
+        with engine.connect() as conn:
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                partes.append(f"{pragma}={conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()}")
+    return ", ".join(partes)
+
+# 4. Ingestão de votos em lote (group commit)
+# Com VOTOS_EM_LOTE=1, /api/votar entrega o voto a um único escritor que grava
+# vários votos por commit (ver app/ingestao.py). Desligado = um commit por voto.
+VOTOS_EM_LOTE = os.getenv("VOTOS_EM_LOTE", "0") == "1"
+LOTE_MAX_VOTOS = int(os.getenv("LOTE_MAX_VOTOS", 200))
+LOTE_ESPERA_MS = float(os.getenv("LOTE_ESPERA_MS", 2))
+LOTE_FILA_MAX = int(os.getenv("LOTE_FILA_MAX", 5000))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 5. Engine assíncrono (rotas quentes dos delegados)
+# Mesmo banco, driver assíncrono: aiosqlite no SQLite, asyncpg no PostgreSQL.
+# Quem espera o banco nessas rotas não ocupa uma thread do threadpool.
+def _url_async(url: str):
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite": return u.set(drivername="sqlite+aiosqlite"), {}
+    if u.get_backend_name() == "postgresql":
+        # asyncpg não aceita ?sslmode=; vira o argumento ssl do connect
+        sslmode = u.query.get("sslmode")
+        args = {"ssl": sslmode not in ("disable", "allow", "prefer")} if sslmode else {}
+        return u.difference_update_query(["sslmode"]).set(drivername="postgresql+asyncpg"), args
+    return u, {}
+
+_url_assincrona, _args_assincronos = _url_async(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(_url_assincrona, connect_args=_args_assincronos, **_opcoes_pool(SQLALCHEMY_DATABASE_URL))
+if E_SQLITE: event.listen(async_engine.sync_engine, "connect", _pragmas_sqlite)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+def insert_ignorando_conflito(tabela):
+    """INSERT que ignora violação de unique (ON CONFLICT DO NOTHING).
+
+    Nos bancos sem suporte devolve um INSERT comum; o chamador trata o IntegrityError.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(tabela).on_conflict_do_nothing()
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(tabela).on_conflict_do_nothing()
+    return insert(tabela)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,27 +1,53 @@
 import os
+import time
+import queue
 import smtplib
 import ssl
+import threading
+from collections import deque
+from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from pydantic import EmailStr
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import Session
+from app import models
+from app.database import engine
 
 MAIL_USERNAME = os.getenv("MAIL_USERNAME", "")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "")
 MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
 MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "1") != "0"
 
-async def enviar_token_email(destinatario: EmailStr, nome: str, token: str, user_id: str):
+# --- ENVIO DE E-MAIL EM SEGUNDO PLANO ---
+# O auto-cadastro grava um registro PENDENTE em envios_email (tipo "cadastro")
+# e só coloca o pedido numa fila em memória. EMAIL_REMETENTES threads próprias
+# fazem o SMTP (bloqueante) fora do event loop, reaproveitando a conexão
+# enquanto houver fila. Falhas voltam para a fila com espera exponencial até
+# EMAIL_MAX_TENTATIVAS; o resultado fica no banco. No startup os PENDENTE
+# deixados por uma parada são retomados.
+
+EMAIL_REMETENTES = int(os.getenv("EMAIL_REMETENTES", 2))
+EMAIL_FILA_MAX = int(os.getenv("EMAIL_FILA_MAX", 1000))
+EMAIL_MAX_TENTATIVAS = int(os.getenv("EMAIL_MAX_TENTATIVAS", 5))
+EMAIL_BACKOFF_SEGUNDOS = float(os.getenv("EMAIL_BACKOFF_SEGUNDOS", 5))
+EMAIL_OCIOSO_SEGUNDOS = float(os.getenv("EMAIL_OCIOSO_SEGUNDOS", 10))  # fecha a conexão SMTP sem fila
+EMAIL_PARADA_SEGUNDOS = float(os.getenv("EMAIL_PARADA_SEGUNDOS", 35))  # prazo total para os remetentes encerrarem
+
+TIPO = "cadastro"
+
+def montar_email(destinatario: str, nome: str, token: str, user_id: str):
     html = f"""
     <div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #e2e8f0; max-width: 600px; background-color: #ffffff;">
         <h2 style="color: #002d62;">Assembleia Regional</h2>
         <p>Olá, <b>{nome}</b>!</p>
         <p>Seu código de acesso para a votação:</p>
-        
+
         <div style="background-color: #f0f9ff; padding: 20px; text-align: center; margin: 20px 0; border: 2px dashed #002d62;">
             <h1 style="margin: 0; color: #002d62; letter-spacing: 5px; font-size: 2.5em;">{token}</h1>
             <p style="margin: 5px 0 0 0;">ID: <b>{user_id}</b></p>
         </div>
-        
+
         <p style="color: #be123c; font-size: 0.9em;">
             ⚠️ Apresente-se à mesa para liberar seu voto.
         </p>
@@ -33,26 +59,189 @@ async def enviar_token_email(destinatario: EmailStr, nome: str, token: str, user
     msg['To'] = destinatario
     msg['Subject'] = "Codigo de Votacao - Assembleia PE"
     msg.attach(MIMEText(html, 'html'))
+    return msg
+
+class _Envio:
+    __slots__ = ("id", "destinatario", "nome", "token", "user_id", "tentativas", "criado")
+
+    def __init__(self, id, destinatario, nome, token, user_id, tentativas=0):
+        self.id = id
+        self.destinatario = destinatario
+        self.nome = nome
+        self.token = token
+        self.user_id = user_id
+        self.tentativas = tentativas
+        self.criado = time.monotonic()
+
+class _Conexao:
+    def __init__(self):
+        self.smtp = None
+
+    def enviar(self, destinatario: str, msg):
+        if self.smtp is None: self._abrir()
+        try: self.smtp.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._abrir()
+            self.smtp.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
+
+    def _abrir(self):
+        self.fechar()
+        s = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=30)
+        s.ehlo()
+        if MAIL_STARTTLS:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            s.starttls(context=context)
+            s.ehlo()
+        if MAIL_USERNAME: s.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self.smtp = s
+
+    def fechar(self):
+        if self.smtp is None: return
+        try: self.smtp.quit()
+        except Exception: pass
+        self.smtp = None
+
+_fila = queue.Queue(maxsize=EMAIL_FILA_MAX)
+_threads = []
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"enviados": 0, "falhas": 0, "tentativas_extras": 0, "em_envio": 0, "aguardando_retentativa": 0}
+_latencias = deque(maxlen=500)  # (segundos na fila até o envio, segundos de SMTP)
+
+_ATUALIZAR = models.EnvioEmail.__table__.update()\
+    .where(models.EnvioEmail.__table__.c.id == bindparam("b_id"))\
+    .values(status=bindparam("b_status"), tentativas=bindparam("b_tentativas"), ultimo_erro=bindparam("b_erro"),
+            atualizado_em=bindparam("b_quando"), enviado_em=bindparam("b_enviado"))
 
+def _gravar(envio: _Envio, status: str, erro: str = None):
+    agora = datetime.utcnow()
     try:
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-
-        with smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=30) as server:
-            server.ehlo()
-            
-            server.starttls(context=context)
-            
-            server.ehlo()
-            
-            # Login
-            server.login(MAIL_USERNAME, MAIL_PASSWORD)
-            
-            # Envia
-            server.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
-            
-        print(f"EMAIL SUCESSO: Enviado para {destinatario}")
+        with engine.begin() as conn:
+            conn.execute(_ATUALIZAR, {"b_id": envio.id, "b_status": status, "b_tentativas": envio.tentativas, "b_erro": erro,
+                                      "b_quando": agora, "b_enviado": agora if status == "ENVIADO" else None})
+    except Exception as e:
+        print(f"EMAIL ERRO: Falha ao gravar o envio {envio.id} ({status}). Erro: {e}")
+
+def _colocar(envio: _Envio) -> bool:
+    try: _fila.put_nowait(envio)
+    except queue.Full:
+        # Fica PENDENTE no banco e é retomado no próximo startup
+        print(f"EMAIL AVISO: Fila cheia, envio para {envio.destinatario} adiado")
+        return False
+    return True
+
+def _reagendar(envio: _Envio):
+    with _stats_lock: _stats["aguardando_retentativa"] -= 1
+    _colocar(envio)
 
+def _processar(conexao: _Conexao, envio: _Envio):
+    envio.tentativas += 1
+    inicio = time.monotonic()
+    try:
+        conexao.enviar(envio.destinatario, montar_email(envio.destinatario, envio.nome, envio.token, envio.user_id))
     except Exception as e:
-        print(f"EMAIL ERRO (IGNORADO): Falha ao enviar para {destinatario}. Erro: {e}")
\ No newline at end of file
+        if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)): conexao.fechar()
+        if envio.tentativas >= EMAIL_MAX_TENTATIVAS:
+            with _stats_lock: _stats["falhas"] += 1
+            _gravar(envio, "FALHOU", str(e)[:500])
+            print(f"EMAIL ERRO: Desistindo de {envio.destinatario} após {envio.tentativas} tentativas. Erro: {e}")
+            return
+        _gravar(envio, "PENDENTE", str(e)[:500])
+        atraso = EMAIL_BACKOFF_SEGUNDOS * 2 ** (envio.tentativas - 1)
+        with _stats_lock:
+            _stats["tentativas_extras"] += 1
+            _stats["aguardando_retentativa"] += 1
+        t = threading.Timer(atraso, _reagendar, (envio,))
+        t.daemon = True
+        t.start()
+        print(f"EMAIL ERRO: Falha ao enviar para {envio.destinatario} (tentativa {envio.tentativas}, nova em {atraso:g}s). Erro: {e}")
+        return
+    fim = time.monotonic()
+    with _stats_lock:
+        _stats["enviados"] += 1
+        _latencias.append((fim - envio.criado, fim - inicio))
+    _gravar(envio, "ENVIADO")
+    print(f"EMAIL SUCESSO: Enviado para {envio.destinatario}")
+
+def _loop():
+    conexao = _Conexao()
+    try:
+        while True:
+            try: envio = _fila.get(timeout=EMAIL_OCIOSO_SEGUNDOS)
+            except queue.Empty:
+                conexao.fechar()
+                continue
+            if envio is None: return
+            with _stats_lock: _stats["em_envio"] += 1
+            try: _processar(conexao, envio)
+            finally:
+                with _stats_lock: _stats["em_envio"] -= 1
+    finally:
+        conexao.fechar()
+
+def registrar_cadastro(db: Session, user_id: str, destinatario: str) -> models.EnvioEmail:
+    """Prepara o registro PENDENTE do e-mail do auto-cadastro na transação do chamador (sem commit)."""
+    e = models.EnvioEmail
+    registro = db.query(e).filter(e.usuario_id == user_id, e.tipo == TIPO).first()
+    # ID reaproveitado de um delegado apagado: recomeça o registro antigo
+    if registro is None: registro = e(usuario_id=user_id, tipo=TIPO)
+    registro.destinatario, registro.status, registro.tentativas = destinatario, "PENDENTE", 0
+    registro.ultimo_erro, registro.enviado_em, registro.atualizado_em = None, None, datetime.utcnow()
+    db.add(registro)
+    return registro
+
+def enfileirar_cadastro(registro: models.EnvioEmail, nome: str, token: str):
+    """Entrega aos remetentes um registro de registrar_cadastro, depois do commit."""
+    iniciar()
+    _colocar(_Envio(registro.id, registro.destinatario, nome, token, registro.usuario_id))
+
+def _retomar():
+    # Reivindica cada PENDENTE trocando atualizado_em: com vários workers, só um fica com ele
+    e, u = models.EnvioEmail, models.Usuario
+    tabela = e.__table__
+    with engine.begin() as conn:
+        pendentes = conn.execute(
+            select(e.id, e.destinatario, e.tentativas, e.atualizado_em, u.nome, u.token, u.id.label("uid"))
+            .join(u, u.id == e.usuario_id).where(e.tipo == TIPO, e.status == "PENDENTE").order_by(e.id)
+        ).all()
+    retomados = 0
+    for p in pendentes:
+        with engine.begin() as conn:
+            filtro = tabela.c.atualizado_em == p.atualizado_em if p.atualizado_em else tabela.c.atualizado_em.is_(None)
+            ok = conn.execute(tabela.update().where(tabela.c.id == p.id, filtro).values(atualizado_em=datetime.utcnow())).rowcount
+        if ok and _colocar(_Envio(p.id, p.destinatario, p.nome, p.token, p.uid, p.tentativas or 0)): retomados += 1
+    if retomados: print(f"EMAIL: {retomados} envios pendentes retomados")
+
+def iniciar(retomar: bool = False):
+    with _lock:
+        vivos = [t for t in _threads if t.is_alive()]
+        if not vivos:
+            _threads[:] = [threading.Thread(target=_loop, name=f"email-{i}", daemon=True) for i in range(EMAIL_REMETENTES)]
+            for t in _threads: t.start()
+    if retomar: _retomar()
+
+def parar():
+    """Encerra os remetentes após o envio em andamento; o que sobrar na fila segue PENDENTE no banco."""
+    with _lock:
+        while True:
+            try: _fila.get_nowait()
+            except queue.Empty: break
+        # Avisa todos antes de esperar: o prazo é um só, não um por remetente
+        prazo = time.monotonic() + EMAIL_PARADA_SEGUNDOS
+        try:
+            for _ in _threads: _fila.put(None, timeout=max(0, prazo - time.monotonic()))
+        except queue.Full: pass
+        for t in _threads: t.join(max(0, prazo - time.monotonic()))
+        _threads.clear()
+
+def metricas() -> dict:
+    with _stats_lock:
+        res = dict(_stats)
+        lat = list(_latencias)
+    res["fila"] = _fila.qsize()
+    for nome, i in (("latencia_total_ms", 0), ("latencia_smtp_ms", 1)):
+        xs = sorted(x[i] for x in lat)
+        res[nome] = {"p50": round(xs[len(xs) // 2] * 1000, 1), "p95": round(xs[int(len(xs) * 0.95)] * 1000, 1)} if xs else None
+    return res
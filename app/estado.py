@@ -0,0 +1,88 @@
+import json
+import threading
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+
+# --- ESTADO DA SESSÃO (SNAPSHOT VERSIONADO) ---
+# Assembleia ativa e suas pautas, lidas uma vez e servidas da memória até a
+# próxima mutação administrativa (ativar/editar/apagar assembleia, criar/
+# editar/apagar pauta, mudar status), que chama invalidar() e incrementa a
+# versão. Votos não mudam o snapshot. Cada processo (worker) tem o seu.
+
+class PautaSnapshot:
+    """Cópia desligada da sessão com os campos de models.Pauta usados nas rotas."""
+    __slots__ = ("id", "titulo", "assembleia_id", "status", "tipo", "max_escolhas", "candidatos_str", "candidatos")
+
+    def __init__(self, p: models.Pauta):
+        self.id = p.id
+        self.titulo = p.titulo
+        self.assembleia_id = p.assembleia_id
+        self.status = p.status
+        self.tipo = p.tipo
+        self.max_escolhas = p.max_escolhas
+        self.candidatos_str = p.candidatos_str
+        self.candidatos = json.loads(p.candidatos_str) if p.candidatos_str else []
+
+class AssembleiaSnapshot:
+    __slots__ = ("id", "titulo")
+
+    def __init__(self, id: str, titulo: str):
+        self.id = id
+        self.titulo = titulo
+
+class Estado:
+    __slots__ = ("versao", "assembleia", "pautas", "aberta", "ultima")
+
+    def __init__(self, versao: int, assembleia, pautas: list):
+        self.versao = versao
+        self.assembleia = assembleia
+        self.pautas = pautas  # em ordem de criação (seq)
+        self.aberta = next((p for p in pautas if p.status == "ABERTA"), None)
+        self.ultima = pautas[-1] if pautas else None
+
+    @property
+    def pauta_atual(self):
+        """A pauta aberta ou, se não houver, a mais recente."""
+        return self.aberta or self.ultima
+
+_lock = threading.Lock()
+_versao = 1
+_atual = None
+
+def versao() -> int:
+    return _versao
+
+def _ler(db: Session):
+    asm = db.query(models.Assembleia.id, models.Assembleia.titulo).filter(models.Assembleia.ativa == True).first()
+    if not asm: return None, []
+    pautas = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).order_by(models.Pauta.seq, models.Pauta.id).all()
+    return AssembleiaSnapshot(asm.id, asm.titulo), [PautaSnapshot(p) for p in pautas]
+
+def _em_cache():
+    with _lock: return _atual, _versao
+
+def _guardar(lido, versao_lida: int) -> Estado:
+    global _atual
+    est = Estado(versao_lida, *lido)
+    # Não guarda o que foi lido se houve mutação durante a consulta
+    with _lock:
+        if versao_lida == _versao: _atual = est
+    return est
+
+def snapshot(db: Session) -> Estado:
+    est, v = _em_cache()
+    if est is not None: return est
+    return _guardar(_ler(db), v)
+
+async def snapshot_async(db: AsyncSession) -> Estado:
+    est, v = _em_cache()
+    if est is not None: return est
+    return _guardar(await db.run_sync(_ler), v)
+
+def invalidar():
+    """Chamar após o commit de qualquer mutação de assembleia ou pauta."""
+    global _versao, _atual
+    with _lock:
+        _versao += 1
+        _atual = None
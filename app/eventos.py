@@ -0,0 +1,128 @@
+import os
+import uuid
+import asyncio
+import threading
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal, AsyncSessionLocal
+from app import estado
+from app.respostas import dumps
+
+# --- PUSH DE ESTADO (SERVER-SENT EVENTS) ---
+# Cada mutação relevante (pauta aberta/encerrada, troca de assembleia ativa,
+# voto registrado) chama publicar(), que incrementa a versão e acorda os
+# streams. Cada stream reenvia o payload no máximo EVENTOS_POR_SEGUNDO vezes
+# por segundo, juntando as mudanças que chegarem nesse intervalo.
+# O payload de cada versão é montado uma vez só e compartilhado por todos os
+# streams da mesma rota; o que é de cada conexão (ex.: o voto do delegado)
+# entra depois, sem consulta ao banco.
+# O estado é por processo, assim como a apuração em memória.
+
+EVENTOS_POR_SEGUNDO = float(os.getenv("EVENTOS_POR_SEGUNDO", 2))
+KEEPALIVE_SEGUNDOS = 15
+
+_lock = threading.Lock()
+_versao = 0
+_loop = None
+_evento = None
+_streams = 0
+_payloads = {}  # montar -> (versão, Task com (payload, texto))
+
+def versao_atual() -> int:
+    return _versao
+
+def streams_abertos() -> int:
+    return _streams
+
+def publicar():
+    """Marca que o estado mudou. Pode ser chamada de qualquer thread."""
+    global _versao
+    with _lock: _versao += 1
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_acordar)
+
+# --- RESPOSTAS CONDICIONAIS (ETag) ---
+# O ETag junta a versão do snapshot de estado e a versão de publicar(), que
+# muda a cada voto e mutação. O prefixo do processo evita que um ETag antigo
+# bata por coincidência depois de um restart (os contadores recomeçam).
+_PROCESSO = uuid.uuid4().hex[:8]
+
+def etag(*extra) -> str:
+    return '"' + "-".join([_PROCESSO, str(estado.versao()), str(_versao), *map(str, extra)]) + '"'
+
+def condicional(request: Request, response: Response, tag: str):
+    """Retorna um 304 se o If-None-Match do cliente bate com `tag`; senão marca a resposta com o ETag."""
+    enviados = request.headers.get("if-none-match")
+    if enviados and (enviados.strip() == "*" or tag in [t.strip() for t in enviados.split(",")]):
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
+
+def _acordar():
+    global _evento
+    ev, _evento = _evento, asyncio.Event()
+    ev.set()
+
+async def _aguardar_mudanca(versao_vista: int, timeout: float) -> bool:
+    global _loop, _evento
+    if _loop is None:
+        _loop = asyncio.get_running_loop()
+        _evento = asyncio.Event()
+    if _versao != versao_vista: return True
+    try: await asyncio.wait_for(_evento.wait(), timeout)
+    except asyncio.TimeoutError: pass
+    return _versao != versao_vista
+
+def _com_sessao(montar):
+    db = SessionLocal()
+    try: return montar(db=db)
+    finally: db.close()
+
+async def _com_sessao_async(montar):
+    async with AsyncSessionLocal() as db: return await montar(db=db)
+
+async def _construir(montar):
+    if asyncio.iscoroutinefunction(montar): payload = await _com_sessao_async(montar)
+    else: payload = await run_in_threadpool(_com_sessao, montar)
+    return payload, dumps(payload).decode()
+
+async def _payload(montar, versao: int):
+    # Só o event loop mexe em _payloads: o primeiro stream a ver a versão monta, os outros esperam a mesma Task
+    atual = _payloads.get(montar)
+    falhou = atual is not None and atual[1].done() and (atual[1].cancelled() or atual[1].exception() is not None)
+    if atual is None or atual[0] != versao or falhou:
+        atual = _payloads[montar] = (versao, asyncio.ensure_future(_construir(montar)))
+    return await asyncio.shield(atual[1])
+
+def stream_estado(request: Request, montar, ajustar=None, autorizado=None) -> StreamingResponse:
+    """Resposta SSE que envia `montar(db=...)` a cada mudança de estado.
+
+    `montar` pode ser síncrona (roda no threadpool) ou uma corrotina (sessão
+    assíncrona) e é chamada uma vez por versão para todos os streams.
+    `ajustar(payload)` (corrotina, opcional) personaliza o payload para esta
+    conexão. `autorizado()` (síncrona, opcional) é conferida antes de cada
+    envio; se retornar False o stream é encerrado.
+    """
+    intervalo = 1 / EVENTOS_POR_SEGUNDO if EVENTOS_POR_SEGUNDO > 0 else 0
+
+    async def gerar():
+        global _streams
+        versao = -1
+        _streams += 1  # só o event loop mexe neste contador
+        try:
+            while not await request.is_disconnected():
+                if autorizado is not None and not await run_in_threadpool(autorizado): return
+                if versao != _versao:
+                    versao = _versao
+                    payload, texto = await _payload(montar, versao)
+                    if ajustar is not None: texto = dumps(await ajustar(payload)).decode()
+                    yield f"id: {versao}\ndata: {texto}\n\n"
+                    await asyncio.sleep(intervalo)
+                elif not await _aguardar_mudanca(versao, KEEPALIVE_SEGUNDOS):
+                    yield ": keepalive\n\n"
+        finally:
+            _streams -= 1
+
+    return StreamingResponse(gerar(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,154 @@
+import io
+import csv
+import json
+import zipfile
+import tempfile
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+from app import models
+from app.apuracao import contagens
+from app.database import SessionLocal
+
+# --- EXPORTAÇÃO EM MEMÓRIA CONSTANTE ---
+# Cada aba vem de uma consulta set-based lida em blocos (cursor do servidor no
+# PostgreSQL). O XLSX usa o modo write-only do openpyxl, que grava as linhas
+# em disco à medida que são geradas; o CSV (zip com três arquivos) é gerado e
+# enviado ao cliente linha a linha.
+
+LOTE_LINHAS = 1000
+CHUNK_BYTES = 64 * 1024
+
+HF = Font(name='Calibri', size=12, bold=True, color="FFFFFF")
+FILL = PatternFill(start_color="002d62", end_color="002d62", fill_type="solid")
+CA = Alignment(horizontal='center', vertical='center')
+BD = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+
+def _pautas(db: Session, asm):
+    return db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).order_by(models.Pauta.seq, models.Pauta.id).all() if asm else []
+
+def _resumo(db: Session, pautas: list):
+    ids = [p.id for p in pautas]
+    totais = dict(db.query(models.Voto.pauta_id, func.count()).filter(models.Voto.pauta_id.in_(ids)).group_by(models.Voto.pauta_id).all()) if ids else {}
+    apuracoes = contagens(db, ids)
+    for i, p in enumerate(pautas, 1):
+        apur = sorted(apuracoes[p.id].items(), key=lambda i: i[1], reverse=True)
+        yield [i, p.titulo, p.tipo, p.status, totais.get(p.id, 0), ", ".join(f"{k}: {n}" for k, n in apur)]
+
+def _formatar_voto(tipo: str, escolha_str: str) -> str:
+    val = json.loads(escolha_str)
+    if isinstance(val, list): return ", ".join(val)
+    if tipo == "SIMPLES": return "A FAVOR" if val == "favor" else str(val).upper()
+    return str(val)
+
+def _detalhamento(db: Session, pautas: list):
+    if not pautas: return
+    ordem = case({p.id: i for i, p in enumerate(pautas)}, value=models.Voto.pauta_id)
+    linhas = db.query(models.Pauta.titulo, models.Pauta.tipo, models.Voto.usuario_id, models.Voto.escolha_str, models.Usuario.nome, models.Usuario.grupo)\
+        .join(models.Pauta, models.Pauta.id == models.Voto.pauta_id)\
+        .outerjoin(models.Usuario, models.Usuario.id == models.Voto.usuario_id)\
+        .filter(models.Voto.pauta_id.in_([p.id for p in pautas]))\
+        .order_by(ordem, models.Voto.id)\
+        .execution_options(stream_results=True).yield_per(LOTE_LINHAS)
+    for titulo, tipo, usuario_id, escolha_str, nome, grupo in linhas:
+        yield [titulo, usuario_id, nome or "?", f"GE {grupo or '-'}", _formatar_voto(tipo, escolha_str)]
+
+def _credenciados(db: Session):
+    u = models.Usuario
+    linhas = db.query(u.id, u.nome, u.grupo, u.email, u.cpf, u.token, u.checkin)\
+        .execution_options(stream_results=True).yield_per(LOTE_LINHAS)
+    for uid, nome, grupo, email, cpf, token, checkin in linhas:
+        yield [uid, nome, grupo, email, cpf, token, "SIM" if checkin else "NÃO"]
+
+def _celulas(ws, valores: list, cabecalho: bool = False, centro: bool = False):
+    res = []
+    for v in valores:
+        c = WriteOnlyCell(ws, value=v)
+        if cabecalho: c.font = HF; c.fill = FILL; c.alignment = CA
+        else:
+            c.border = BD
+            if centro: c.alignment = CA
+        res.append(c)
+    return res
+
+def gerar_xlsx(db: Session, asm):
+    """Gera o relatório XLSX num arquivo temporário e devolve o arquivo posicionado no início."""
+    tn = asm.titulo if asm else "Relatorio"
+    pautas = _pautas(db, asm)
+    wb = Workbook(write_only=True)
+
+    ws1 = wb.create_sheet("Resumo")
+    titulo = WriteOnlyCell(ws1, value=f"RELATÓRIO: {tn.upper()}"); titulo.font = Font(size=14, bold=True, color="002d62"); titulo.alignment = CA
+    ws1.merged_cells.add("A1:F1")
+    ws1.append([titulo])
+    ws1.append(_celulas(ws1, ["Ordem", "Pauta", "Tipo", "Status", "Votos", "Apuração"], cabecalho=True))
+    for linha in _resumo(db, pautas): ws1.append(_celulas(ws1, linha, centro=True))
+
+    ws2 = wb.create_sheet("Detalhamento Votos")
+    ws2.column_dimensions['A'].width=40; ws2.column_dimensions['C'].width=35; ws2.column_dimensions['E'].width=50
+    ws2.append(_celulas(ws2, ["Pauta", "ID", "Nome", "Grupo", "Voto"], cabecalho=True))
+    for linha in _detalhamento(db, pautas): ws2.append(_celulas(ws2, linha))
+
+    ws3 = wb.create_sheet("Credenciados")
+    ws3.column_dimensions['B'].width=35; ws3.column_dimensions['D'].width=35; ws3.column_dimensions['E'].width=15
+    ws3.append(_celulas(ws3, ["ID", "Nome", "Grupo", "Email", "CPF", "Token", "Check-in"], cabecalho=True))
+    for linha in _credenciados(db): ws3.append(_celulas(ws3, linha))
+
+    arq = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    wb.save(arq)
+    arq.seek(0)
+    return arq
+
+def ler_em_blocos(arq):
+    try:
+        while True:
+            bloco = arq.read(CHUNK_BYTES)
+            if not bloco: break
+            yield bloco
+    finally:
+        arq.close()
+
+class _SaidaZip(io.RawIOBase):
+    """Destino não-posicionável para o ZipFile: acumula bytes até serem drenados."""
+    def __init__(self):
+        self.partes = []
+    def writable(self): return True
+    def write(self, b):
+        self.partes.append(bytes(b))
+        return len(b)
+    def drenar(self) -> bytes:
+        dados = b"".join(self.partes)
+        self.partes.clear()
+        return dados
+
+def gerar_csv_zip(asm_id: str):
+    """Gera um zip com Resumo, Detalhamento e Credenciados em CSV, entregando bytes conforme são produzidos."""
+    db = SessionLocal()
+    saida = _SaidaZip()
+    try:
+        asm = db.query(models.Assembleia).filter(models.Assembleia.id == asm_id).first() if asm_id else None
+        pautas = _pautas(db, asm)
+        arquivos = [
+            ("resumo.csv", ["Ordem", "Pauta", "Tipo", "Status", "Votos", "Apuração"], _resumo(db, pautas)),
+            ("detalhamento_votos.csv", ["Pauta", "ID", "Nome", "Grupo", "Voto"], _detalhamento(db, pautas)),
+            ("credenciados.csv", ["ID", "Nome", "Grupo", "Email", "CPF", "Token", "Check-in"], _credenciados(db)),
+        ]
+        with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as zf:
+            for nome, cabecalho, linhas in arquivos:
+                with zf.open(nome, "w") as bruto, io.TextIOWrapper(bruto, encoding="utf-8-sig", newline="") as f:
+                    w = csv.writer(f, delimiter=";")
+                    w.writerow(cabecalho)
+                    for i, linha in enumerate(linhas, 1):
+                        w.writerow(linha)
+                        if i % LOTE_LINHAS == 0:
+                            f.flush()
+                            dados = saida.drenar()
+                            if dados: yield dados
+                dados = saida.drenar()
+                if dados: yield dados
+        yield saida.drenar()
+    finally:
+        db.close()
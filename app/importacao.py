@@ -0,0 +1,114 @@
+import io
+import csv
+import time
+import secrets
+import unicodedata
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from openpyxl import load_workbook
+
+from app import models
+from app.models import validar_cpf_algo
+
+# --- IMPORTAÇÃO EM MASSA DE DELEGADOS ---
+# Lê a planilha inteira, valida em memória e grava com executemany: os tokens
+# existentes, os CPFs e o último número de cada grupo são lidos uma única vez.
+# Tudo vai num único commit; se um auto-cadastro simultâneo ocupar um id,
+# token ou CPF nesse meio tempo, o lote é desfeito e validado de novo.
+
+LOTE_INSERT = 1000
+TENTATIVAS = 3
+
+_COLUNAS = {"nome": "nome", "grupo": "grupo", "ge": "grupo", "grupo no": "grupo", "grupo n": "grupo", "grupo n.": "grupo", "cpf": "cpf", "email": "email", "e-mail": "email"}
+_ORDEM_PADRAO = ["nome", "grupo", "cpf", "email"]
+
+def _chave(texto) -> str:
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode()
+    return texto.strip().lower()
+
+def _linhas_brutas(nome_arquivo: str, conteudo: bytes):
+    if nome_arquivo.lower().endswith(".xlsx"):
+        wb = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+        for linha in wb.worksheets[0].iter_rows(values_only=True):
+            yield ["" if v is None else str(v).strip() for v in linha]
+        wb.close()
+        return
+    texto = conteudo.decode("utf-8-sig", errors="replace")
+    try: dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=";,\t")
+    except csv.Error: dialeto = csv.excel
+    for linha in csv.reader(io.StringIO(texto), dialeto):
+        yield [v.strip() for v in linha]
+
+def ler_planilha(nome_arquivo: str, conteudo: bytes):
+    """Gera (número da linha, {"nome", "grupo", "cpf", "email"}). Cabeçalho é opcional."""
+    ordem = None
+    for n, valores in enumerate(_linhas_brutas(nome_arquivo, conteudo), 1):
+        if not any(valores): continue
+        if ordem is None:
+            cab = [_COLUNAS.get(_chave(v)) for v in valores]
+            if "nome" in cab:
+                ordem = cab
+                continue
+            ordem = _ORDEM_PADRAO
+        yield n, {campo: valores[i] if i < len(valores) else "" for i, campo in enumerate(ordem) if campo}
+
+def gerar_tokens(existentes: set, quantidade: int) -> list:
+    """Sorteia `quantidade` tokens que não estão em `existentes` (que é atualizado)."""
+    novos = []
+    while len(novos) < quantidade:
+        t = secrets.token_hex(3).upper()
+        if t not in existentes:
+            existentes.add(t)
+            novos.append(t)
+    return novos
+
+def importar(db: Session, linhas) -> dict:
+    inicio = time.perf_counter()
+    linhas = list(linhas)
+    for tentativa in range(TENTATIVAS):
+        try:
+            total, registros, erros = _gravar(db, linhas)
+            break
+        except IntegrityError:
+            db.rollback()
+            if tentativa == TENTATIVAS - 1: raise
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "msg": "ok", "linhas": total, "inseridos": len(registros), "erros": erros,
+        "segundos": round(segundos, 3), "linhas_por_segundo": round(total / segundos, 1) if segundos else None,
+        "delegados": [{"id": r["id"], "nome": r["nome"], "grupo": r["grupo"], "token": r["token"]} for r in registros],
+    }
+
+def _gravar(db: Session, linhas: list):
+    validas, erros, total = [], [], 0
+    cpfs = {c for (c,) in db.query(models.Usuario.cpf_digits).filter(models.Usuario.cpf_digits != None)}
+    for n, d in linhas:
+        total += 1
+        nome, grupo, cpf, email = d.get("nome", ""), d.get("grupo", ""), d.get("cpf", ""), d.get("email", "")
+        digitos = models.so_digitos(cpf)
+        if not nome or not grupo: erros.append({"linha": n, "erro": "Nome e grupo são obrigatórios"}); continue
+        if cpf and not validar_cpf_algo(cpf): erros.append({"linha": n, "erro": f"CPF inválido: {cpf}"}); continue
+        if digitos and digitos in cpfs: erros.append({"linha": n, "erro": f"CPF já cadastrado: {cpf}"}); continue
+        if email and "@" not in email: erros.append({"linha": n, "erro": f"E-mail inválido: {email}"}); continue
+        if digitos: cpfs.add(digitos)
+        validas.append((nome, grupo, cpf, digitos, email))
+
+    grupos = {g for _, g, _, _, _ in validas}
+    proximo = {g: 1 for g in grupos}
+    if grupos:
+        for g, maximo in db.query(models.Usuario.grupo, func.max(models.Usuario.seq)).filter(models.Usuario.grupo.in_(grupos)).group_by(models.Usuario.grupo):
+            proximo[g] = (maximo or 0) + 1
+    tokens = gerar_tokens({t for (t,) in db.query(models.Usuario.token)}, len(validas))
+
+    registros = []
+    for (nome, grupo, cpf, digitos, email), token in zip(validas, tokens):
+        seq = proximo[grupo]; proximo[grupo] += 1
+        registros.append({"id": f"{grupo}-{seq}", "token": token, "nome": nome, "grupo": grupo, "seq": seq,
+                          "cpf": cpf, "cpf_digits": digitos or None, "email": email, "checkin": False})
+    tabela = models.Usuario.__table__
+    for i in range(0, len(registros), LOTE_INSERT):
+        db.execute(tabela.insert(), registros[i:i + LOTE_INSERT])
+    db.commit()
+    return total, registros, erros
@@ -0,0 +1,147 @@
+import json
+import time
+import asyncio
+import queue
+import threading
+from sqlalchemy import select, literal, union_all
+from app import models
+from app.database import engine, insert_ignorando_conflito, LOTE_MAX_VOTOS, LOTE_ESPERA_MS, LOTE_FILA_MAX
+
+# --- INGESTÃO DE VOTOS EM LOTE (GROUP COMMIT) ---
+# Os votos aceitos entram numa fila limitada. Uma única thread escritora junta
+# até LOTE_MAX_VOTOS votos (esperando no máximo LOTE_ESPERA_MS por mais) e os
+# grava num INSERT de várias linhas com um só commit. Quem chamou registrar()
+# só recebe a resposta depois que o lote do seu voto foi commitado.
+
+class FilaCheia(Exception):
+    pass
+
+class _Pedido:
+    __slots__ = ("linha", "pronto", "inserido", "erro", "loop", "futuro")
+
+    def __init__(self, linha: dict, loop=None):
+        self.linha = linha
+        self.pronto = threading.Event()
+        self.inserido = False
+        self.erro = None
+        # Pedido de rota assíncrona: a resposta volta por um Future no loop de quem pediu
+        self.loop = loop
+        self.futuro = loop.create_future() if loop else None
+
+    def concluir(self):
+        self.pronto.set()
+        if self.futuro is not None: self.loop.call_soon_threadsafe(self._resolver)
+
+    def _resolver(self):
+        if self.futuro.done(): return
+        if self.erro: self.futuro.set_exception(self.erro)
+        else: self.futuro.set_result(self.inserido)
+
+_fila = queue.Queue(maxsize=LOTE_FILA_MAX)
+_thread = None
+_lock = threading.Lock()
+
+def registrar(pauta_id: str, usuario_id: str, escolha_str: str) -> bool:
+    """Grava o voto pelo escritor em lote. True se inserido, False se o delegado já votou."""
+    iniciar()
+    pedido = _Pedido({"pauta_id": pauta_id, "usuario_id": usuario_id, "escolha_str": escolha_str})
+    try: _fila.put_nowait(pedido)
+    except queue.Full: raise FilaCheia()
+    pedido.pronto.wait()
+    if pedido.erro: raise pedido.erro
+    return pedido.inserido
+
+async def registrar_async(pauta_id: str, usuario_id: str, escolha_str: str) -> bool:
+    """registrar() para rotas assíncronas: aguarda o lote sem bloquear o loop."""
+    iniciar()
+    pedido = _Pedido({"pauta_id": pauta_id, "usuario_id": usuario_id, "escolha_str": escolha_str}, asyncio.get_running_loop())
+    try: _fila.put_nowait(pedido)
+    except queue.Full: raise FilaCheia()
+    return await pedido.futuro
+
+def tamanho_fila() -> int:
+    return _fila.qsize()
+
+_COLUNAS_VOTO = ("pauta_id", "usuario_id", "escolha_str")
+
+def _insert_se_aberta(linhas: list):
+    # INSERT ... SELECT com a pauta ainda ABERTA no banco: o cache de status é por
+    # processo, e com vários workers só este filtro barra voto em pauta já encerrada
+    pautas = models.Pauta.__table__
+    selects = [select(*(literal(l[c]).label(c) for c in _COLUNAS_VOTO)) for l in linhas]
+    fonte = (selects[0] if len(selects) == 1 else union_all(*selects)).subquery("novos")
+    consulta = select(*(fonte.c[c] for c in _COLUNAS_VOTO))\
+        .join_from(fonte, pautas, pautas.c.id == fonte.c.pauta_id).where(pautas.c.status == "ABERTA")
+    return insert_ignorando_conflito(models.Voto.__table__).from_select(list(_COLUNAS_VOTO), consulta)
+
+def inserir_votos(conn, linhas: list) -> set:
+    """Insere os votos das pautas abertas e suas escolhas normalizadas, ignorando quem já votou.
+
+    `linhas` são dicts com pauta_id, usuario_id e escolha_str. Retorna as chaves
+    (pauta_id, usuario_id) efetivamente inseridas. `conn` pode ser uma Connection ou Session.
+    """
+    tabela = models.Voto.__table__
+    if getattr(engine.dialect, "insert_returning", False):
+        res = conn.execute(_insert_se_aberta(linhas).returning(tabela.c.id, tabela.c.pauta_id, tabela.c.usuario_id))
+        novos = {(r.pauta_id, r.usuario_id): r.id for r in res}
+    else:
+        novos = {}
+        for l in linhas:
+            if not conn.execute(_insert_se_aberta([l])).rowcount: continue
+            novos[(l["pauta_id"], l["usuario_id"])] = conn.execute(
+                select(tabela.c.id).where(tabela.c.pauta_id == l["pauta_id"], tabela.c.usuario_id == l["usuario_id"])).scalar()
+    escolhas = []
+    for l in linhas:
+        voto_id = novos.get((l["pauta_id"], l["usuario_id"]))
+        if voto_id is not None: escolhas += models.VotoEscolha.linhas(voto_id, l["pauta_id"], json.loads(l["escolha_str"]))
+    if escolhas: conn.execute(models.VotoEscolha.__table__.insert(), escolhas)
+    return set(novos)
+
+def _gravar(lote: list):
+    # Dois pedidos do mesmo delegado no mesmo lote: só o primeiro conta
+    unicos, vistos = [], set()
+    for p in lote:
+        chave = (p.linha["pauta_id"], p.linha["usuario_id"])
+        if chave not in vistos: vistos.add(chave); unicos.append(p)
+    try:
+        with engine.begin() as conn:
+            inseridos = inserir_votos(conn, [p.linha for p in unicos])
+        for p in unicos: p.inserido = (p.linha["pauta_id"], p.linha["usuario_id"]) in inseridos
+    except Exception:
+        # Falha no lote: regrava um a um para isolar o voto com problema
+        for p in unicos:
+            try:
+                with engine.begin() as conn: p.inserido = bool(inserir_votos(conn, [p.linha]))
+            except Exception as e: p.erro = e
+    for p in lote: p.concluir()
+
+def _loop():
+    while True:
+        pedido = _fila.get()
+        if pedido is None: return
+        lote = [pedido]
+        limite = time.monotonic() + LOTE_ESPERA_MS / 1000
+        while len(lote) < LOTE_MAX_VOTOS:
+            try: proximo = _fila.get(timeout=max(0, limite - time.monotonic()))
+            except queue.Empty: break
+            if proximo is None:
+                _gravar(lote)
+                return
+            lote.append(proximo)
+        _gravar(lote)
+
+def iniciar():
+    global _thread
+    if _thread is not None and _thread.is_alive(): return
+    with _lock:
+        if _thread is not None and _thread.is_alive(): return
+        _thread = threading.Thread(target=_loop, name="votos-em-lote", daemon=True)
+        _thread.start()
+
+def parar():
+    """Grava o que ainda estiver na fila e encerra o escritor."""
+    global _thread
+    if _thread is None: return
+    _fila.put(None)
+    _thread.join(10)
+    _thread = None
@@ -1,21 +1,97 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+import os
+import secrets
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.middleware.gzip import GZipMiddleware, DEFAULT_EXCLUDED_CONTENT_TYPES
 from fastapi.templating import Jinja2Templates
 from app.routers import admin, delegado
-from app import models
-from app.database import engine
+from app import models, migracoes
+from app.database import engine, async_engine, SessionLocal, VOTOS_EM_LOTE, descrever_engine
+from app.apuracao import carregar_abertas
+from app import presenca, ingestao, senhas, email_utils, metricas, apuracao, eventos, estado
 
 models.Base.metadata.create_all(bind=engine)
+migracoes.aplicar(engine)
 
 app = FastAPI()
 
+# --- COMPRESSÃO ---
+# gzip para quem aceita, nas respostas com mais de COMPRESSAO_MINIMO_BYTES
+# (0 desliga). SSE e arquivos já compactados (zip, xlsx) passam direto.
+COMPRESSAO_MINIMO_BYTES = int(os.getenv("COMPRESSAO_MINIMO_BYTES", 1024))
+COMPRESSAO_NIVEL = int(os.getenv("COMPRESSAO_NIVEL", 6))
+if COMPRESSAO_MINIMO_BYTES > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSAO_MINIMO_BYTES, compresslevel=COMPRESSAO_NIVEL,
+                       exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",))
+app.add_middleware(metricas.MetricasMiddleware)
+metricas.instrumentar(engine, async_engine.sync_engine)
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 app.include_router(admin.router)
 app.include_router(delegado.router)
 
+@app.on_event("startup")
+def log_banco(): print(f"BANCO: {descrever_engine()}")
+
+@app.on_event("startup")
+def carregar_apuracao():
+    db = SessionLocal()
+    try: carregar_abertas(db)
+    finally: db.close()
+
+@app.on_event("startup")
+def iniciar_presenca(): presenca.iniciar()
+
+@app.on_event("shutdown")
+def parar_presenca(): presenca.parar()
+
+@app.on_event("startup")
+def iniciar_ingestao():
+    if VOTOS_EM_LOTE: ingestao.iniciar()
+
+@app.on_event("shutdown")
+def parar_ingestao(): ingestao.parar()
+
+@app.on_event("shutdown")
+def parar_senhas(): senhas.parar()
+
+@app.on_event("startup")
+def iniciar_email(): email_utils.iniciar(retomar=True)
+
+@app.on_event("shutdown")
+def parar_email(): email_utils.parar()
+
+# --- MÉTRICAS ---
+# Sem METRICS_TOKEN o /metrics é aberto; com ele, exige ?token= ou "Authorization: Bearer".
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+def _medidores() -> dict:
+    ap = apuracao.estatisticas()
+    em = email_utils.metricas()
+    lat = lambda k, p: em[k][p] / 1000 if em[k] else None
+    return {
+        "app_db_conexoes_em_uso": engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else None,
+        "app_apuracao_pautas": ap["pautas"], "app_apuracao_votos": ap["votos"],
+        "app_apuracao_consultas_total": ap["consultas"], "app_apuracao_cargas_total": ap["cargas"],
+        "app_votos_fila_lote": ingestao.tamanho_fila(),
+        "app_sse_streams": eventos.streams_abertos(),
+        "app_estado_versao": estado.versao(),
+        "app_email_fila": em["fila"], "app_email_em_envio": em["em_envio"], "app_email_aguardando_retentativa": em["aguardando_retentativa"],
+        "app_email_enviados_total": em["enviados"], "app_email_falhas_total": em["falhas"], "app_email_retentativas_total": em["tentativas_extras"],
+        "app_email_latencia_p50_segundos": lat("latencia_total_ms", "p50"), "app_email_latencia_p95_segundos": lat("latencia_total_ms", "p95"),
+        "app_email_smtp_p95_segundos": lat("latencia_smtp_ms", "p95"),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request, token: str = None):
+    if METRICS_TOKEN:
+        enviado = token or request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not secrets.compare_digest(enviado, METRICS_TOKEN): raise HTTPException(401)
+    return PlainTextResponse(metricas.texto(_medidores()), media_type="text/plain; version=0.0.4")
+
 @app.get("/", response_class=HTMLResponse)
 def read_root(request: Request): return templates.TemplateResponse("delegado.html", {"request": request})
 
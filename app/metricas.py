@@ -0,0 +1,159 @@
+import time
+import threading
+from contextvars import ContextVar
+from sqlalchemy import event
+from anyio.to_thread import current_default_thread_limiter
+
+# --- MÉTRICAS (FORMATO TEXTO DO PROMETHEUS) ---
+# Um middleware ASGI mede cada requisição por rota (o template, ex.
+# /api/pautas/{id}) e conta as instruções SQL executadas durante ela via
+# eventos do engine; a contagem segue a requisição por ContextVar, inclusive
+# no threadpool e nas sessões assíncronas. SQL fora de requisição (threads
+# de fundo) entra como rota "(fundo)". /metrics junta isso com o estado das
+# filas e caches. Tudo é por processo (worker).
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_SQL = (0, 1, 2, 5, 10, 20, 50, 100)
+FUNDO = "(fundo)"
+
+class _Histograma:
+    __slots__ = ("limites", "contagens", "soma", "total")
+
+    def __init__(self, limites: tuple):
+        self.limites = limites
+        self.contagens = [0] * len(limites)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite: self.contagens[i] += 1; break
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome: str, rotulos: str) -> list:
+        res, acumulado = [], 0
+        for limite, n in zip(self.limites, self.contagens):
+            acumulado += n
+            res.append(f'{nome}_bucket{{{rotulos},le="{limite:g}"}} {acumulado}')
+        res.append(f'{nome}_bucket{{{rotulos},le="+Inf"}} {self.total}')
+        res.append(f"{nome}_sum{{{rotulos}}} {self.soma:.6f}")
+        res.append(f"{nome}_count{{{rotulos}}} {self.total}")
+        return res
+
+class _Requisicao:
+    __slots__ = ("sql", "sql_segundos")
+
+    def __init__(self):
+        self.sql = 0
+        self.sql_segundos = 0.0
+
+_atual = ContextVar("metricas_requisicao", default=None)
+_lock = threading.Lock()
+_duracao = {}  # (método, rota) -> _Histograma
+_sql_por_req = {}  # (método, rota) -> _Histograma
+_respostas = {}  # (método, rota, status) -> n
+_sql = {}  # rota -> [instruções, segundos]
+_em_andamento = 0
+
+def _rota(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "(sem rota)"
+
+class MetricasMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _em_andamento
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        req = _Requisicao()
+        token = _atual.set(req)
+        info = {"status": 500, "stream": False}
+
+        async def enviar(msg):
+            if msg["type"] == "http.response.start":
+                info["status"] = msg["status"]
+                info["stream"] = any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in msg.get("headers", []))
+            await send(msg)
+
+        with _lock: _em_andamento += 1
+        inicio = time.perf_counter()
+        try: await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            _atual.reset(token)
+            chave = (scope["method"], _rota(scope))
+            with _lock:
+                _em_andamento -= 1
+                _respostas[chave + (info["status"],)] = _respostas.get(chave + (info["status"],), 0) + 1
+                # Streams SSE duram a conexão inteira: ficam fora dos histogramas
+                if not info["stream"]:
+                    _duracao.setdefault(chave, _Histograma(BUCKETS_SEGUNDOS)).observar(duracao)
+                    _sql_por_req.setdefault(chave, _Histograma(BUCKETS_SQL)).observar(req.sql)
+                acc = _sql.setdefault(chave[1], [0, 0.0])
+                acc[0] += req.sql
+                acc[1] += req.sql_segundos
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    pilha = conn.info.get("metricas_inicio")
+    if not pilha: return
+    segundos = time.perf_counter() - pilha.pop()
+    req = _atual.get()
+    if req is not None:
+        req.sql += 1
+        req.sql_segundos += segundos
+        return
+    with _lock:
+        acc = _sql.setdefault(FUNDO, [0, 0.0])
+        acc[0] += 1
+        acc[1] += segundos
+
+def instrumentar(*engines):
+    """Liga a contagem de SQL nos engines (para o AsyncEngine, passe .sync_engine)."""
+    for e in engines:
+        if event.contains(e, "before_cursor_execute", _antes): continue
+        event.listen(e, "before_cursor_execute", _antes)
+        event.listen(e, "after_cursor_execute", _depois)
+
+def _esc(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def texto(medidores: dict = None) -> str:
+    """Exposição no formato texto do Prometheus. Deve rodar no event loop (lê o limitador do threadpool).
+
+    `medidores` são valores extras {nome: valor}; nomes terminados em _total saem como counter.
+    """
+    limitador = current_default_thread_limiter()
+    linhas = []
+    with _lock:
+        linhas += ["# HELP app_requisicao_segundos Duração das requisições HTTP por rota (sem streams SSE).",
+                   "# TYPE app_requisicao_segundos histogram"]
+        for (metodo, rota), h in sorted(_duracao.items()):
+            linhas += h.linhas("app_requisicao_segundos", f'metodo="{metodo}",rota="{_esc(rota)}"')
+        linhas += ["# HELP app_sql_por_requisicao Instruções SQL executadas por requisição.",
+                   "# TYPE app_sql_por_requisicao histogram"]
+        for (metodo, rota), h in sorted(_sql_por_req.items()):
+            linhas += h.linhas("app_sql_por_requisicao", f'metodo="{metodo}",rota="{_esc(rota)}"')
+        linhas += ["# HELP app_respostas_total Respostas HTTP por rota e status.", "# TYPE app_respostas_total counter"]
+        for (metodo, rota, status), n in sorted(_respostas.items()):
+            linhas.append(f'app_respostas_total{{metodo="{metodo}",rota="{_esc(rota)}",status="{status}"}} {n}')
+        linhas += ["# HELP app_sql_total Instruções SQL por rota.", "# TYPE app_sql_total counter"]
+        linhas += [f'app_sql_total{{rota="{_esc(r)}"}} {n}' for r, (n, _) in sorted(_sql.items())]
+        linhas += ["# HELP app_sql_segundos_total Tempo gasto em SQL por rota.", "# TYPE app_sql_segundos_total counter"]
+        linhas += [f'app_sql_segundos_total{{rota="{_esc(r)}"}} {s:.6f}' for r, (_, s) in sorted(_sql.items())]
+        em_andamento = _em_andamento
+    gauges = {
+        "app_requisicoes_em_andamento": em_andamento,
+        "app_threadpool_ocupadas": limitador.borrowed_tokens,
+        "app_threadpool_limite": limitador.total_tokens,
+        "app_threadpool_aguardando": limitador.statistics().tasks_waiting,
+        **(medidores or {}),
+    }
+    for nome, valor in gauges.items():
+        if valor is None: continue
+        linhas += [f"# TYPE {nome} {'counter' if nome.endswith('_total') else 'gauge'}", f"{nome} {valor}"]
+    return "\n".join(linhas) + "\n"
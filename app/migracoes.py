@@ -0,0 +1,134 @@
+import json
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from app import models
+
+# --- MIGRAÇÕES ---
+# create_all só cria tabelas que ainda não existem. Estes passos levam bancos
+# já em uso (sql_app.db, PostgreSQL do Render) ao esquema atual dos models.
+# Cada passo é idempotente e roda no startup.
+
+def _indices(engine: Engine, tabela: str) -> set:
+    return {ix["name"] for ix in inspect(engine).get_indexes(tabela)}
+
+def _colunas(engine: Engine, tabela: str) -> set:
+    return {c["name"] for c in inspect(engine).get_columns(tabela)}
+
+def _adicionar_coluna(engine: Engine, tabela: str, coluna: str, tipo: str) -> bool:
+    if coluna in _colunas(engine, tabela): return False
+    with engine.begin() as conn: conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+    print(f"MIGRAÇÃO: coluna {tabela}.{coluna} criada")
+    return True
+
+def _criar_indices(engine: Engine, tabela, nomes: set):
+    existentes = _indices(engine, tabela.name)
+    for ix in tabela.indexes:
+        if ix.name in nomes and ix.name not in existentes:
+            ix.create(bind=engine)
+            print(f"MIGRAÇÃO: índice {ix.name} criado")
+
+def _unique_votos(engine: Engine):
+    if "ux_votos_pauta_usuario" in _indices(engine, "votos"): return
+    with engine.begin() as conn:
+        # Mantém só o primeiro voto de cada delegado por pauta antes de criar o índice
+        removidos = conn.execute(text(
+            "DELETE FROM votos WHERE id NOT IN (SELECT MIN(id) FROM votos GROUP BY pauta_id, usuario_id)"
+        )).rowcount
+        if removidos: print(f"MIGRAÇÃO: {removidos} votos duplicados removidos")
+    for ix in models.Voto.__table__.indexes:
+        if ix.name == "ux_votos_pauta_usuario": ix.create(bind=engine, checkfirst=True)
+    print("MIGRAÇÃO: índice único votos(pauta_id, usuario_id) criado")
+
+def _backfill_escolhas(engine: Engine):
+    # Votos gravados antes de votos_escolhas existir: decodifica escolha_str uma única vez
+    sql = text(
+        "SELECT v.id, v.pauta_id, v.escolha_str, p.tipo FROM votos v LEFT JOIN pautas p ON p.id = v.pauta_id "
+        "WHERE NOT EXISTS (SELECT 1 FROM votos_escolhas e WHERE e.voto_id = v.id)"
+    )
+    with engine.begin() as conn:
+        linhas = []
+        for voto_id, pauta_id, escolha_str, tipo in conn.execute(sql).all():
+            try: valor = json.loads(escolha_str) if escolha_str else []
+            except ValueError: valor = escolha_str
+            linhas += models.VotoEscolha.linhas(voto_id, pauta_id, valor, simples=tipo == "SIMPLES")
+        for i in range(0, len(linhas), 1000):
+            conn.execute(models.VotoEscolha.__table__.insert(), linhas[i:i + 1000])
+        total = len(linhas)
+    if total: print(f"MIGRAÇÃO: {total} escolhas copiadas de votos.escolha_str para votos_escolhas")
+
+def _cpf_e_seq_usuarios(engine: Engine):
+    indices = {"ux_usuarios_cpf_digits", "ix_usuarios_grupo_seq"}
+    # Os índices são criados no fim deste passo: se já existem, o preenchimento já rodou.
+    # CPFs repetidos e ids fora do padrão "grupo-N" ficam NULL para sempre e não contam como pendentes
+    if "usuarios" in inspect(engine).get_table_names() and indices <= _indices(engine, "usuarios"): return
+    _adicionar_coluna(engine, "usuarios", "cpf_digits", "VARCHAR")
+    _adicionar_coluna(engine, "usuarios", "seq", "INTEGER")
+    with engine.begin() as conn:
+        pendentes = conn.execute(text(
+            "SELECT id, grupo, cpf, cpf_digits, seq FROM usuarios WHERE (cpf_digits IS NULL AND cpf IS NOT NULL AND cpf <> '') OR seq IS NULL"
+        )).all()
+        if pendentes:
+            usados = {r[0] for r in conn.execute(text("SELECT cpf_digits FROM usuarios WHERE cpf_digits IS NOT NULL"))}
+            linhas, repetidos = [], 0
+            for uid, grupo, cpf, atual, seq in pendentes:
+                digitos = None if atual else (models.so_digitos(cpf) or None)
+                # CPF repetido em bases antigas: só o primeiro fica com cpf_digits
+                if digitos in usados: digitos = None; repetidos += 1
+                elif digitos: usados.add(digitos)
+                novo_seq = None if seq is not None else models.seq_do_id(uid, grupo)
+                if digitos or novo_seq is not None: linhas.append({"b_id": uid, "b_cpf": digitos, "b_seq": novo_seq})
+            if linhas:
+                conn.execute(text("UPDATE usuarios SET cpf_digits = COALESCE(cpf_digits, :b_cpf), seq = COALESCE(seq, :b_seq) WHERE id = :b_id"), linhas)
+                print(f"MIGRAÇÃO: cpf_digits/seq preenchidos em {len(linhas)} delegados ({repetidos} CPFs repetidos ignorados)")
+    _criar_indices(engine, models.Usuario.__table__, indices)
+
+def _seq_pautas(engine: Engine):
+    _adicionar_coluna(engine, "pautas", "seq", "INTEGER")
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM pautas WHERE seq IS NULL")).scalar():
+            # A ordem de criação não foi guardada: aproxima pelo primeiro voto de cada pauta
+            # (sem votos vão para o fim) e, no SQLite, pela ordem de inserção (rowid)
+            desempate = "p.rowid" if engine.dialect.name == "sqlite" else "p.id"
+            ids = [r[0] for r in conn.execute(text(
+                "SELECT p.id FROM pautas p LEFT JOIN (SELECT pauta_id, MIN(id) AS primeiro FROM votos GROUP BY pauta_id) v "
+                f"ON v.pauta_id = p.id WHERE p.seq IS NULL ORDER BY CASE WHEN v.primeiro IS NULL THEN 1 ELSE 0 END, v.primeiro, {desempate}"
+            ))]
+            inicio = conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM pautas")).scalar()
+            conn.execute(text("UPDATE pautas SET seq = :b_seq WHERE id = :b_id"), [{"b_id": pid, "b_seq": inicio + i + 1} for i, pid in enumerate(ids)])
+            print(f"MIGRAÇÃO: seq preenchido em {len(ids)} pautas")
+
+def _indices_consultas(engine: Engine):
+    # Índices dos filtros quentes: votos do delegado, pautas por assembleia/status, assembleia ativa
+    _criar_indices(engine, models.Voto.__table__, {"ix_votos_usuario_pauta"})
+    _criar_indices(engine, models.Pauta.__table__, {"ix_pautas_assembleia_seq", "ix_pautas_status_assembleia"})
+    _criar_indices(engine, models.Assembleia.__table__, {"ix_assembleias_ativa"})
+
+def _escolhas_repetidas(engine: Engine):
+    # Votos SIMPLES enviados como lista (ex.: ["contra"] * 50) e candidatos repetidos na
+    # mesma cédula geravam várias linhas por voto: fica só a primeira de cada um. Roda
+    # uma vez, antes de criar o índice único (voto_id, escolha) que passa a barrar repetições
+    if "ux_votos_escolhas_voto_escolha" in _indices(engine, "votos_escolhas"): return
+    with engine.begin() as conn:
+        simples = conn.execute(text(
+            "DELETE FROM votos_escolhas WHERE posicao > 0 AND pauta_id IN (SELECT id FROM pautas WHERE tipo = 'SIMPLES')"
+        )).rowcount
+        repetidas = conn.execute(text(
+            "DELETE FROM votos_escolhas WHERE EXISTS (SELECT 1 FROM votos_escolhas e WHERE e.voto_id = votos_escolhas.voto_id "
+            "AND e.escolha = votos_escolhas.escolha AND e.posicao < votos_escolhas.posicao)"
+        )).rowcount
+    if simples or repetidas: print(f"MIGRAÇÃO: {simples + repetidas} escolhas repetidas removidas de votos_escolhas")
+    _criar_indices(engine, models.VotoEscolha.__table__, {"ux_votos_escolhas_voto_escolha"})
+
+def aplicar(engine: Engine):
+    _unique_votos(engine)
+    _backfill_escolhas(engine)
+    _escolhas_repetidas(engine)
+    _cpf_e_seq_usuarios(engine)
+    _seq_pautas(engine)
+    _indices_consultas(engine)
+
+if __name__ == "__main__":
+    # python -m app.migracoes  (aplica sem subir o servidor)
+    from app.database import engine
+    models.Base.metadata.create_all(bind=engine)
+    aplicar(engine)
@@ -1,8 +1,28 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Index, func
+from sqlalchemy.orm import relationship, validates
 from .database import Base
 from datetime import datetime
 
+def so_digitos(texto: str) -> str:
+    return "".join(filter(str.isdigit, texto or ""))
+
+def validar_cpf_algo(cpf: str) -> bool:
+    numbers = [int(digit) for digit in cpf if digit.isdigit()]
+    if len(numbers) != 11: return False
+    if len(set(numbers)) == 1: return False
+    sum_prod = sum(a*b for a, b in zip(numbers[0:9], range(10, 1, -1)))
+    expected = (sum_prod * 10 % 11) % 10
+    if numbers[9] != expected: return False
+    sum_prod = sum(a*b for a, b in zip(numbers[0:10], range(11, 1, -1)))
+    expected = (sum_prod * 10 % 11) % 10
+    if numbers[10] != expected: return False
+    return True
+
+def seq_do_id(user_id: str, grupo: str):
+    """Extrai N de um id "grupo-N" (None se o id não seguir o padrão)."""
+    sufixo = (user_id or "")[len(grupo or "") + 1:] if (user_id or "").startswith(f"{grupo}-") else ""
+    return int(sufixo) if sufixo.isdigit() else None
+
 class Admin(Base):
     __tablename__ = "admins"
     usuario = Column(String, primary_key=True, index=True)
@@ -13,6 +33,7 @@ class Assembleia(Base):
     id = Column(String, primary_key=True, index=True)
     titulo = Column(String)
     ativa = Column(Boolean, default=False)
+    __table_args__ = (Index("ix_assembleias_ativa", "ativa"),)
 
 class Usuario(Base):
     __tablename__ = "usuarios"
@@ -24,6 +45,22 @@ class Usuario(Base):
     email = Column(String) 
     checkin = Column(Boolean, default=False)
     last_seen = Column(DateTime, nullable=True)
+    cpf_digits = Column(String, nullable=True)  # só os dígitos do CPF; NULL quando não informado
+    seq = Column(Integer, nullable=True)  # N do id "grupo-N"
+    __table_args__ = (
+        Index("ux_usuarios_cpf_digits", "cpf_digits", unique=True),
+        Index("ix_usuarios_grupo_seq", "grupo", "seq"),
+    )
+
+    @validates("cpf")
+    def _normalizar_cpf(self, key, cpf):
+        self.cpf_digits = so_digitos(cpf) or None
+        return cpf
+
+    @staticmethod
+    def proximo_seq(db, grupo: str) -> int:
+        atual = db.query(func.max(Usuario.seq)).filter(Usuario.grupo == grupo).scalar()
+        return (atual or 0) + 1
 
 class Pauta(Base):
     __tablename__ = "pautas"
@@ -34,10 +71,60 @@ class Pauta(Base):
     tipo = Column(String, default="SIMPLES")      
     max_escolhas = Column(Integer, default=1)
     candidatos_str = Column(Text, default="")     
+    seq = Column(Integer, nullable=True)  # ordem de criação (o id é uuid4, não ordena)
+    __table_args__ = (
+        Index("ix_pautas_assembleia_seq", "assembleia_id", "seq"),
+        Index("ix_pautas_status_assembleia", "status", "assembleia_id"),
+    )
+
+    @staticmethod
+    def proximo_seq(db) -> int:
+        atual = db.query(func.max(Pauta.seq)).scalar()
+        return (atual or 0) + 1
 
 class Voto(Base):
     __tablename__ = "votos"
     id = Column(Integer, primary_key=True, index=True)
     pauta_id = Column(String, ForeignKey("pautas.id"))
     usuario_id = Column(String, ForeignKey("usuarios.id"))
-    escolha_str = Column(Text)
\ No newline at end of file
+    escolha_str = Column(Text)
+    __table_args__ = (
+        Index("ux_votos_pauta_usuario", "pauta_id", "usuario_id", unique=True),
+        Index("ix_votos_usuario_pauta", "usuario_id", "pauta_id"),
+    )
+
+class VotoEscolha(Base):
+    # Uma linha por (voto, escolha): permite contar com GROUP BY sem decodificar escolha_str
+    __tablename__ = "votos_escolhas"
+    voto_id = Column(Integer, ForeignKey("votos.id"), primary_key=True)
+    posicao = Column(Integer, primary_key=True, default=0)
+    pauta_id = Column(String, ForeignKey("pautas.id"))
+    escolha = Column(String)
+    __table_args__ = (
+        Index("ix_votos_escolhas_pauta_escolha", "pauta_id", "escolha"),
+        Index("ux_votos_escolhas_voto_escolha", "voto_id", "escolha", unique=True),
+    )
+
+    @staticmethod
+    def linhas(voto_id: int, pauta_id: str, valor, simples: bool = False) -> list:
+        """Uma linha por escolha distinta; no máximo uma num voto SIMPLES."""
+        valores = list(dict.fromkeys(valor if isinstance(valor, list) else [valor]))
+        if simples: valores = valores[:1]
+        return [{"voto_id": voto_id, "posicao": i, "pauta_id": pauta_id, "escolha": str(v)} for i, v in enumerate(valores)]
+
+class EnvioEmail(Base):
+    # Fila de saída de e-mails: um registro por (delegado, tipo), com o estado do envio
+    __tablename__ = "envios_email"
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(String)
+    tipo = Column(String, default="credencial")
+    destinatario = Column(String)
+    status = Column(String, default="PENDENTE")  # PENDENTE | ENVIADO | FALHOU
+    tentativas = Column(Integer, default=0)
+    ultimo_erro = Column(Text, nullable=True)
+    atualizado_em = Column(DateTime, nullable=True)
+    enviado_em = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ux_envios_email_usuario_tipo", "usuario_id", "tipo", unique=True),
+        Index("ix_envios_email_status", "status", "id"),
+    )
@@ -0,0 +1,74 @@
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+
+# --- PRESENÇA EM MEMÓRIA (WRITE-BEHIND) ---
+# Heartbeats, login e logout atualizam apenas este dicionário (token -> last_seen).
+# Uma thread grava os valores alterados em um único UPDATE em lote a cada
+# PRESENCA_FLUSH_SEGUNDOS. Na falta do token aqui (ex.: após reiniciar),
+# vale o last_seen salvo no banco.
+
+PRESENCA_FLUSH_SEGUNDOS = float(os.getenv("PRESENCA_FLUSH_SEGUNDOS", 30))
+
+_lock = threading.Lock()
+_last_seen = {}
+_pendentes = set()
+_parar = threading.Event()
+_thread = None
+
+def obter(token: str, padrao: datetime = None):
+    with _lock: return _last_seen.get(token, padrao)
+
+def conhecido(token: str) -> bool:
+    with _lock: return token in _last_seen
+
+def registrar(token: str, quando: datetime = None):
+    with _lock:
+        _last_seen[token] = quando or datetime.utcnow()
+        _pendentes.add(token)
+
+def remover(token: str):
+    with _lock:
+        _last_seen.pop(token, None)
+        _pendentes.discard(token)
+
+def flush(db: Session = None) -> int:
+    """Grava no banco os last_seen alterados desde o último flush."""
+    with _lock:
+        lote = [{"b_token": t, "b_last_seen": _last_seen[t]} for t in _pendentes if t in _last_seen]
+        _pendentes.clear()
+    if not lote: return 0
+    tabela = models.Usuario.__table__
+    stmt = tabela.update().where(tabela.c.token == bindparam("b_token")).values(last_seen=bindparam("b_last_seen"))
+    propria = db is None
+    db = db or SessionLocal()
+    try:
+        db.execute(stmt, lote)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        with _lock: _pendentes.update(x["b_token"] for x in lote)
+        print(f"PRESENÇA ERRO: Falha ao gravar last_seen ({len(lote)} tokens). Erro: {e}")
+        return 0
+    finally:
+        if propria: db.close()
+    return len(lote)
+
+def _loop():
+    while not _parar.wait(PRESENCA_FLUSH_SEGUNDOS):
+        flush()
+
+def iniciar():
+    global _thread
+    if _thread and _thread.is_alive(): return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="presenca-flush", daemon=True)
+    _thread.start()
+
+def parar():
+    _parar.set()
+    flush()
@@ -0,0 +1,31 @@
+import json
+from datetime import date, datetime
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try: import orjson
+except ImportError: orjson = None
+
+# --- JSON RÁPIDO ---
+# Rotas que montam payloads grandes devolvem RespostaJSON(dados) direto: o
+# FastAPI só roda o jsonable_encoder (que percorre tudo em Python) quando a
+# rota devolve um objeto comum. Com orjson instalado a serialização é feita
+# por ele; sem ele, json da biblioteca padrão em formato compacto. Os dados
+# precisam ser tipos simples (dict/list/str/números/datetime), nunca ORM.
+
+def _padrao(valor):
+    if isinstance(valor, (datetime, date)): return valor.isoformat()
+    return str(valor)
+
+def dumps(dados) -> bytes:
+    if orjson: return orjson.dumps(dados, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(dados, default=_padrao, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class RespostaJSON(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def responder(dados, response: Response = None) -> RespostaJSON:
+    """RespostaJSON levando os cabeçalhos já postos no `response` injetado pelo FastAPI (ex.: ETag)."""
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"} if response is not None else None
+    return RespostaJSON(dados, headers=headers)
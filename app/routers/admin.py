@@ -1,22 +1,30 @@
 import os
-import secrets
+import time
 import uuid
 import json
-import io
+import zipfile
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+from sqlalchemy import select, func, case, or_
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy.exc import IntegrityError
 from jose import JWTError, jwt
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from starlette.concurrency import run_in_threadpool
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app import models
+from app.exportacao import gerar_xlsx, gerar_csv_zip, ler_em_blocos
+from app.importacao import importar, ler_planilha, gerar_tokens
+from app.apuracao import obter_apuracao, aquecer, geracao as geracao_apuracao, invalidar as invalidar_apuracao, invalidar_pautas
+from app.eventos import publicar, stream_estado, etag, condicional
+from app.respostas import RespostaJSON, responder
+from app import presenca, senhas, estado, email_utils
 
 load_dotenv()
 
@@ -27,7 +35,6 @@ SECRET_KEY = os.getenv("SECRET_KEY", "chave-secreta-padrao")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "mudar_senha_em_producao_123")
 
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # --- MODELOS ---
 class SenhaAdmin(BaseModel):
@@ -54,46 +61,129 @@ class DadosEnvioEmail(BaseModel):
     token: str
     id: str
 
-# --- FUNÇÕES AUXILIARES ---
-def get_password_hash(password):
-    if len(password) > 70: password = password[:70]
-    return pwd_context.hash(password)
+# Saídas enxutas: só as colunas que a tela usa, sem o FastAPI percorrer o objeto ORM
+class AdminSaida(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    usuario: str
+class AssembleiaSaida(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    titulo: Optional[str] = None
+    ativa: Optional[bool] = None
+class ListaAssembleias(BaseModel):
+    lista: List[AssembleiaSaida]
+    ativa: Optional[str] = None
+class PautaSaida(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    titulo: Optional[str] = None
+    assembleia_id: Optional[str] = None
+    status: Optional[str] = None
+    tipo: Optional[str] = None
+    max_escolhas: Optional[int] = None
+    candidatos_str: Optional[str] = None
+    seq: Optional[int] = None
+class DelegadoSaida(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    nome: Optional[str] = None
+    grupo: Optional[str] = None
+    token: Optional[str] = None
+    checkin: Optional[bool] = None
+class GrupoCriado(BaseModel):
+    msg: str
+    delegados: List[DelegadoSaida]
 
-def verificar_senha(plain_password, hashed_password):
-    if len(plain_password) > 70: plain_password = plain_password[:70]
-    return pwd_context.verify(plain_password, hashed_password)
+# --- FUNÇÕES AUXILIARES ---
+def apagar_votos(db: Session, *filtros):
+    """Apaga os votos que atendem aos filtros, junto com suas escolhas normalizadas."""
+    ids = select(models.Voto.id).where(*filtros)
+    db.query(models.VotoEscolha).filter(models.VotoEscolha.voto_id.in_(ids)).delete(synchronize_session=False)
+    db.query(models.Voto).filter(*filtros).delete(synchronize_session=False)
 
 def criar_token_acesso(data: dict):
     to_encode = data.copy()
     to_encode.update({"exp": datetime.utcnow() + timedelta(minutes=120)})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# --- CACHE DE AUTENTICAÇÃO ---
+# O painel consulta /api/dados-admin a cada 2 s; tokens já verificados ficam
+# em memória por ADMIN_CACHE_SEGUNDOS (nunca além do exp do JWT). add_admin e
+# del_admin removem as entradas do admin afetado na hora.
+ADMIN_CACHE_SEGUNDOS = float(os.getenv("ADMIN_CACHE_SEGUNDOS", "30"))
+ADMIN_CACHE_MAX = 256
+_admins_verificados = OrderedDict()  # token -> (usuario, expira_em)
+_admins_lock = threading.Lock()
+
+def _admin_em_cache(token: str):
+    with _admins_lock:
+        item = _admins_verificados.get(token)
+        if not item: return None
+        if item[1] <= time.time():
+            del _admins_verificados[token]
+            return None
+        return item[0]
+
+def _guardar_admin(token: str, usuario: str, exp):
+    expira = time.time() + ADMIN_CACHE_SEGUNDOS
+    if exp: expira = min(expira, float(exp))
+    with _admins_lock:
+        _admins_verificados[token] = (usuario, expira)
+        while len(_admins_verificados) > ADMIN_CACHE_MAX: _admins_verificados.popitem(last=False)
+
+def invalidar_admin(usuario: str):
+    with _admins_lock:
+        for t in [t for t, (u, _) in _admins_verificados.items() if u == usuario]: del _admins_verificados[t]
+
 def verificar_admin(x_admin_token: str = Header(None), token_query: str = Query(None), db: Session = Depends(get_db)):
     token = x_admin_token or token_query
     if not token: raise HTTPException(401, "Token required")
+    user = _admin_em_cache(token)
+    if user: return user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user = payload.get("sub")
-        if user == "admin": return "admin"
-        db_admin = db.query(models.Admin).filter(models.Admin.usuario == user).first()
-        if not db_admin: raise HTTPException(401, "Invalid")
+        if user != "admin" and not db.query(models.Admin.usuario).filter(models.Admin.usuario == user).first():
+            raise HTTPException(401, "Invalid")
+        _guardar_admin(token, user, payload.get("exp"))
         return user
     except JWTError: raise HTTPException(401, "Invalid")
 
 # --- ROTAS DE AUTENTICAÇÃO ---
-@router.post("/admin/login")
-def admin_login(dados: SenhaAdmin, db: Session = Depends(get_db)):
-    usuario_input = dados.usuario.strip()
-    senha_input = dados.senha.strip()
-    if usuario_input == "admin" and senha_input == ADMIN_PASSWORD:
+_hash_superusuario_ok = False
+
+def _buscar_admin(usuario: str):
+    db = SessionLocal()
+    try: return db.query(models.Admin.usuario, models.Admin.senha_hash).filter(models.Admin.usuario == usuario).first()
+    finally: db.close()
+
+def _gravar_hash_superusuario(novo_hash: str):
+    db = SessionLocal()
+    try:
         adm_db = db.query(models.Admin).filter(models.Admin.usuario == "admin").first()
-        novo_hash = get_password_hash(ADMIN_PASSWORD)
         if not adm_db: db.add(models.Admin(usuario="admin", senha_hash=novo_hash))
         else: adm_db.senha_hash = novo_hash
         db.commit()
+    finally: db.close()
+
+async def _sincronizar_superusuario():
+    # O hash do "admin" só é regravado quando ADMIN_PASSWORD mudou (confere uma vez por processo)
+    global _hash_superusuario_ok
+    if _hash_superusuario_ok: return
+    adm = await run_in_threadpool(_buscar_admin, "admin")
+    if not adm or not await senhas.conferir_async(ADMIN_PASSWORD, adm.senha_hash):
+        await run_in_threadpool(_gravar_hash_superusuario, await senhas.gerar_hash_async(ADMIN_PASSWORD))
+    _hash_superusuario_ok = True
+
+@router.post("/admin/login")
+async def admin_login(dados: SenhaAdmin):
+    usuario_input = dados.usuario.strip()
+    senha_input = dados.senha.strip()
+    if usuario_input == "admin" and senha_input == ADMIN_PASSWORD:
+        await _sincronizar_superusuario()
         return {"token": criar_token_acesso(data={"sub": "admin"})}
-    adm = db.query(models.Admin).filter(models.Admin.usuario == usuario_input).first()
-    if not adm or not verificar_senha(senha_input, adm.senha_hash):
+    adm = await run_in_threadpool(_buscar_admin, usuario_input)
+    if not adm or not await senhas.conferir_async(senha_input, adm.senha_hash):
         raise HTTPException(400, "Usuário ou senha incorretos")
     return {"token": criar_token_acesso(data={"sub": adm.usuario})}
 
@@ -103,37 +193,28 @@ def admin_logout():
 
 # --- ROTAS PRINCIPAIS ---
 @router.get("/telao-dados")
-def get_telao(db: Session = Depends(get_db)):
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
+def get_telao(request: Request, response: Response, db: Session = Depends(get_db)):
+    tag = etag()
+    nao_mudou = condicional(request, response, tag)
+    if nao_mudou: return nao_mudou
+    return responder(montar_telao(db), response)
+
+def montar_telao(db: Session):
+    est = estado.snapshot(db)
+    asm = est.assembleia
     nome = asm.titulo if asm else "Escoteiros"
     if not asm: return {"evento": nome, "pauta": None}
     
-    pauta = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id, models.Pauta.status == "ABERTA").first()
-    if not pauta: pauta = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).order_by(models.Pauta.id.desc()).first()
+    pauta = est.pauta_atual
     if not pauta: return {"evento": nome, "pauta": None}
     
-    votos = db.query(models.Voto).filter(models.Voto.pauta_id == pauta.id).all()
-    candidatos = json.loads(pauta.candidatos_str) if pauta.candidatos_str else []
-    
-    # Contagem de Votos
-    if pauta.tipo == "SIMPLES":
-        cont = {"favor":0, "contra":0, "abstencao":0}
-        for v in votos:
-            val = json.loads(v.escolha_str)
-            if val in cont: cont[val] += 1
-    else:
-        cont = {c: 0 for c in candidatos}
-        for v in votos:
-            vals = json.loads(v.escolha_str)
-            if isinstance(vals, list):
-                for c in vals: 
-                    if c in cont: cont[c] += 1
-            elif vals in cont: cont[vals] += 1
-            
+    apuracao = obter_apuracao(db, pauta)
+    cont = apuracao["contagem"]
+
     res = "ANDAMENTO"
     if pauta.status == "ENCERRADA":
         if pauta.tipo == "SIMPLES":
-            if len(votos) == 0:
+            if apuracao["total"] == 0:
                 res = "SEM VOTOS"
             elif cont["favor"] > cont["contra"]:
                 res = "APROVADA"
@@ -151,24 +232,30 @@ def get_telao(db: Session = Depends(get_db)):
             "status": pauta.status, 
             "tipo": pauta.tipo, 
             "max_escolhas": pauta.max_escolhas, 
-            "total_votos": len(votos), 
+            "total_votos": apuracao["total"], 
             "resultados": cont, 
             "resultado_final": res
         }
     }
 
-@router.get("/assembleias")
+@router.get("/telao-dados/stream")
+async def stream_telao(request: Request):
+    return stream_estado(request, montar_telao)
+
+@router.get("/assembleias", response_model=ListaAssembleias)
 def get_asms(db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     lista = db.query(models.Assembleia).all()
-    ativa = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
+    ativa = estado.snapshot(db).assembleia
     return {"lista": lista, "ativa": ativa.id if ativa else None}
 
-@router.post("/assembleias")
+@router.post("/assembleias", response_model=AssembleiaSaida)
 def add_asm(d: AssembleiaInput, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     nova = models.Assembleia(id=str(uuid.uuid4()), titulo=d.titulo)
     db.add(nova)
     if not db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first(): nova.ativa = True
     db.commit()
+    estado.invalidar()
+    publicar()
     return nova
 
 @router.put("/assembleias/{id}")
@@ -177,6 +264,8 @@ def edit_asm(id: str, d: AssembleiaInput, db: Session = Depends(get_db), u: str
     if not asm: raise HTTPException(404, "Evento não encontrado")
     asm.titulo = d.titulo
     db.commit()
+    estado.invalidar()
+    publicar()
     return {"msg": "ok", "titulo": asm.titulo}
 
 @router.delete("/assembleias/{id}")
@@ -184,11 +273,15 @@ def delete_asm(id: str, db: Session = Depends(get_db), u: str = Depends(verifica
     asm = db.query(models.Assembleia).filter(models.Assembleia.id == id).first()
     if not asm: raise HTTPException(404, "Evento não encontrado")
     pautas = db.query(models.Pauta).filter(models.Pauta.assembleia_id == id).all()
+    pauta_ids = [p.id for p in pautas]
     for p in pautas:
-        db.query(models.Voto).filter(models.Voto.pauta_id == p.id).delete()
+        apagar_votos(db, models.Voto.pauta_id == p.id)
         db.delete(p)
     db.delete(asm)
     db.commit()
+    for pid in pauta_ids: invalidar_apuracao(pid)
+    estado.invalidar()
+    publicar()
     return {"msg": "ok"}
 
 @router.post("/assembleias/{id}/ativar")
@@ -197,25 +290,36 @@ def set_active_asm(id: str, db: Session = Depends(get_db), u: str = Depends(veri
     target = db.query(models.Assembleia).filter(models.Assembleia.id == id).first()
     if target: target.ativa = True
     db.commit()
+    estado.invalidar()
+    publicar()
     return {"msg": "Ok"}
 
 @router.get("/admin/lista-para-email", response_model=List[DadosEnvioEmail])
 def lista_emails_bulk(x_admin_token: str = Header(None), token: str = Query(None), db: Session = Depends(get_db)):
     verificar_admin(x_admin_token, token, db)
-    users = db.query(models.Usuario).filter(models.Usuario.email != None, models.Usuario.email != "").all()
-    resultado = []
-    for u in users: resultado.append({"nome": u.nome, "email": u.email, "token": u.token, "id": u.id})
-    return resultado
-
-@router.get("/admins")
+    usr = models.Usuario
+    linhas = db.query(usr.nome, usr.email, usr.token, usr.id).filter(usr.email != None, usr.email != "")
+    return [{"nome": n, "email": e, "token": t, "id": i} for n, e, t, i in linhas]
+
+@router.get("/emails/metricas")
+def emails_metricas(db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
+    e = models.EnvioEmail
+    falhas = db.query(e).filter(e.tipo == email_utils.TIPO, e.status == "FALHOU").order_by(e.id.desc()).limit(50).all()
+    res = email_utils.metricas()
+    res["falhas_registradas"] = [{"usuario_id": f.usuario_id, "destinatario": f.destinatario, "tentativas": f.tentativas,
+                                  "erro": f.ultimo_erro, "quando": f.atualizado_em} for f in falhas]
+    return res
+
+@router.get("/admins", response_model=List[AdminSaida])
 def list_admins(db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
-    return db.query(models.Admin).all()
+    return db.query(models.Admin.usuario).all()
 
 @router.post("/admins")
 def add_admin(d: NovoAdminInput, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     if db.query(models.Admin).filter(models.Admin.usuario == d.usuario).first(): raise HTTPException(400, "Exists")
-    db.add(models.Admin(usuario=d.usuario, senha_hash=get_password_hash(d.senha)))
+    db.add(models.Admin(usuario=d.usuario, senha_hash=senhas.gerar_hash_no_pool(d.senha)))
     db.commit()
+    invalidar_admin(d.usuario)
     return {"msg": "Ok"}
 
 @router.delete("/admins/{nome}")
@@ -223,108 +327,173 @@ def del_admin(nome: str, db: Session = Depends(get_db), u: str = Depends(verific
     if nome == u: raise HTTPException(400, "Self delete")
     db.query(models.Admin).filter(models.Admin.usuario == nome).delete()
     db.commit()
+    invalidar_admin(nome)
     return {"msg": "Ok"}
 
-@router.post("/grupos")
+@router.post("/grupos", response_model=GrupoCriado)
 def add_grupo_massa(d: GrupoNomesInput, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
-    todos = db.query(models.Usuario).filter(models.Usuario.grupo == d.numero).all()
-    prox = 1
-    if todos:
-        try: prox = max([int(x.id.split('-')[1]) for x in todos]) + 1
-        except: prox = len(todos) + 1
+    prox = models.Usuario.proximo_seq(db, d.numero)
+    tokens = gerar_tokens({t for (t,) in db.query(models.Usuario.token)}, len(d.nomes))
     novos = []
-    for nome in d.nomes:
+    for nome, t in zip(d.nomes, tokens):
         uid = f"{d.numero}-{prox}"
-        while True:
-            t = secrets.token_hex(3).upper()
-            if not db.query(models.Usuario).filter(models.Usuario.token == t).first(): break
-        usr = models.Usuario(id=uid, nome=nome.strip(), grupo=d.numero, token=t, checkin=False, cpf="", email="")
+        usr = models.Usuario(id=uid, nome=nome.strip(), grupo=d.numero, seq=prox, token=t, checkin=False, cpf="", email="")
         db.add(usr)
         novos.append(usr)
         prox += 1
     db.commit()
+    publicar()
     return {"msg": "ok", "delegados": novos}
 
+@router.post("/grupos/importar")
+def importar_delegados(arquivo: UploadFile = File(...), db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
+    nome = arquivo.filename or ""
+    if not nome.lower().endswith((".csv", ".xlsx")): raise HTTPException(400, "Envie um arquivo .csv ou .xlsx")
+    try: res = importar(db, ler_planilha(nome, arquivo.file.read()))
+    except (ValueError, KeyError, zipfile.BadZipFile): raise HTTPException(400, "Arquivo ilegível")
+    except IntegrityError: raise HTTPException(409, "Cadastros simultâneos durante a importação. Tente novamente.")
+    if res["inseridos"]: publicar()
+    return res
+
+# --- GRUPOS E DELEGADOS ---
+# A visão geral é agregada no banco (GROUP BY grupo); os delegados vêm
+# paginados e filtrados de /api/delegados, só com as colunas da tabela.
+# "Online" usa o last_seen gravado pela presença, que chega ao banco com até
+# PRESENCA_FLUSH_SEGUNDOS de atraso, daí a janela maior que o heartbeat.
+ONLINE_SEGUNDOS = float(os.getenv("ONLINE_SEGUNDOS", presenca.PRESENCA_FLUSH_SEGUNDOS + 15))
+
+def _ordem_grupo(coluna):
+    # "2" antes de "10" sem CAST (grupos não numéricos não quebram no PostgreSQL)
+    return (func.length(coluna), coluna)
+
 @router.get("/grupos")
 def list_grupos(db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
-    users = db.query(models.Usuario).all()
-    agg = {}
-    for user in users:
-        if user.grupo not in agg: agg[user.grupo] = []
-        agg[user.grupo].append(user)
-    lst = [{"numero": k, "quantidade": len(v), "delegados": v} for k,v in agg.items()]
-    lst.sort(key=lambda x: int(x["numero"]) if x["numero"].isdigit() else x["numero"])
-    return lst
+    usr = models.Usuario
+    limite = datetime.utcnow() - timedelta(seconds=ONLINE_SEGUNDOS)
+    linhas = db.query(usr.grupo, func.count(usr.id),
+                      func.sum(case((usr.checkin == True, 1), else_=0)),
+                      func.sum(case((usr.last_seen > limite, 1), else_=0)))\
+        .group_by(usr.grupo).order_by(*_ordem_grupo(usr.grupo)).all()
+    return RespostaJSON([{"numero": g, "quantidade": n, "presentes": int(p or 0), "online": int(o or 0)} for g, n, p, o in linhas])
+
+@router.get("/delegados")
+def list_delegados(grupo: str = None, busca: str = None, status: str = None, pagina: int = Query(1, ge=1),
+                   por_pagina: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
+    """Delegados em ordem de grupo e número; `status` é presente/ausente e `busca` procura em nome, token, ID e CPF."""
+    usr = models.Usuario
+    q = db.query(usr.id, usr.nome, usr.grupo, usr.token, usr.checkin)
+    if grupo: q = q.filter(usr.grupo == grupo)
+    if status == "presente": q = q.filter(usr.checkin == True)
+    elif status == "ausente": q = q.filter(or_(usr.checkin == False, usr.checkin == None))
+    if busca and busca.strip():
+        termo = f"%{busca.strip()}%"
+        filtros = [usr.nome.ilike(termo), usr.token.ilike(termo), usr.id.ilike(termo), usr.cpf.like(termo)]
+        digitos = models.so_digitos(busca)
+        if digitos: filtros.append(usr.cpf_digits.like(f"%{digitos}%"))
+        q = q.filter(or_(*filtros))
+    total = q.order_by(None).count()
+    linhas = q.order_by(*_ordem_grupo(usr.grupo), usr.seq, usr.id).offset((pagina - 1) * por_pagina).limit(por_pagina).all()
+    return RespostaJSON({"delegados": [{"id": i, "nome": n, "grupo": g, "token": t, "checkin": bool(c)} for i, n, g, t, c in linhas],
+                         "total": total, "pagina": pagina, "por_pagina": por_pagina})
 
 @router.post("/usuarios/{token}/checkin")
 def toggle_checkin(token: str, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     usr = db.query(models.Usuario).filter(models.Usuario.token == token).first()
-    if usr: usr.checkin = not usr.checkin; db.commit(); return {"msg": "ok"}
+    if usr: usr.checkin = not usr.checkin; db.commit(); publicar(); return {"msg": "ok"}
     raise HTTPException(404)
 
 @router.delete("/usuarios/{token}")
 def del_user(token: str, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     usr = db.query(models.Usuario).filter(models.Usuario.token == token).first()
-    if usr: db.query(models.Voto).filter(models.Voto.usuario_id == usr.id).delete(); db.delete(usr); db.commit(); return {"msg": "ok"}
+    if usr: apagar_votos(db, models.Voto.usuario_id == usr.id); db.delete(usr); db.commit(); presenca.remover(token); invalidar_apuracao(); publicar(); return {"msg": "ok"}
     raise HTTPException(404)
 
 @router.delete("/grupos/{n}")
 def del_grp(n: str, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     usrs = db.query(models.Usuario).filter(models.Usuario.grupo == n).all()
-    for usr in usrs: db.query(models.Voto).filter(models.Voto.usuario_id == usr.id).delete(); db.delete(usr)
-    db.commit(); return {"msg": "ok"}
+    for usr in usrs: apagar_votos(db, models.Voto.usuario_id == usr.id); db.delete(usr); presenca.remover(usr.token)
+    db.commit(); invalidar_apuracao(); publicar(); return {"msg": "ok"}
 
 @router.get("/dados-admin")
-def admin_data(db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
-    if not asm: return {"pautas": [], "assembleia": "Nenhuma"}
+def admin_data(request: Request, response: Response, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
+    tag = etag()
+    nao_mudou = condicional(request, response, tag)
+    if nao_mudou: return nao_mudou
+    return responder(montar_admin(db), response)
+
+def _versao_detalhes(asm) -> str:
+    # Troca de assembleia ativa também invalida o detalhe: o cursor é por assembleia
+    return f"{asm.id if asm else ''}:{geracao_apuracao()}"
+
+def montar_admin(db: Session):
+    # Só os resumos; o detalhe dos votos vem de /api/votos-detalhados a partir do cursor
+    est = estado.snapshot(db)
+    asm = est.assembleia
+    if not asm: return {"pautas": [], "assembleia": "Nenhuma", "cursor": 0, "detalhes_versao": _versao_detalhes(asm)}
     total_users = db.query(models.Usuario).count()
-    pautas = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).all()
-    pautas.reverse()
+    pautas = est.pautas[::-1]
+    # Cursor da assembleia ativa: votos de outras assembleias nunca aparecem no detalhe
+    cursor = db.query(func.max(models.Voto.id)).filter(models.Voto.pauta_id.in_([p.id for p in pautas])).scalar() if pautas else None
     res = []
-    users_map = {u.id: u for u in db.query(models.Usuario).all()}
+    aquecer(db, pautas)
     for p in pautas:
-        votos = db.query(models.Voto).filter(models.Voto.pauta_id == p.id).all()
-        dets = []
-        cands = json.loads(p.candidatos_str) if p.candidatos_str else []
-        if p.tipo == "SIMPLES":
-            cont = {"favor":0, "contra":0, "abstencao":0}
-            for v in votos:
-                val = json.loads(v.escolha_str)
-                if val in cont: cont[val] += 1
-                usr = users_map.get(v.usuario_id)
-                dets.append({"credencial": v.usuario_id, "nome": usr.nome if usr else "?", "grupo": usr.grupo if usr else "-", "voto": val})
-        else:
-            cont = {c: 0 for c in cands}
-            for v in votos:
-                vals = json.loads(v.escolha_str)
-                v_str = ""
-                if isinstance(vals, list):
-                    for c in vals: 
-                        if c in cont: cont[c] += 1
-                    v_str = ", ".join(vals)
-                else: v_str = str(vals)
-                usr = users_map.get(v.usuario_id)
-                dets.append({"credencial": v.usuario_id, "nome": usr.nome if usr else "?", "grupo": usr.grupo if usr else "-", "voto": v_str})
-            cont = dict(sorted(cont.items(), key=lambda i: i[1], reverse=True))
+        apuracao = obter_apuracao(db, p)
+        cont = apuracao["contagem"]
+        cands = p.candidatos
+        if p.tipo != "SIMPLES": cont = dict(sorted(cont.items(), key=lambda i: i[1], reverse=True))
         final = "ANDAMENTO"
         if p.status == "ENCERRADA":
             if p.tipo == "SIMPLES": 
-                if len(votos)==0: final="SEM VOTOS"
+                if apuracao["total"]==0: final="SEM VOTOS"
                 elif cont["favor"] > cont["contra"]: final = "APROVADA" 
                 elif cont["contra"] > cont["favor"]: final = "REPROVADA"
                 else: final = "EMPATE"
             else: final = "CONCLUÍDA"
-        res.append({"id": p.id, "titulo": p.titulo, "status": p.status, "tipo": p.tipo, "candidatos": cands, "max_escolhas": p.max_escolhas, "total_votos": len(votos), "esperados": total_users, "resultados": cont, "resultado_final": final, "votos_detalhados": dets})
-    return {"pautas": res, "assembleia": asm.titulo}
-
-@router.post("/pautas")
+        res.append({"id": p.id, "titulo": p.titulo, "status": p.status, "tipo": p.tipo, "candidatos": cands, "max_escolhas": p.max_escolhas, "total_votos": apuracao["total"], "esperados": total_users, "resultados": cont, "resultado_final": final})
+    return {"pautas": res, "assembleia": asm.titulo, "cursor": cursor or 0, "detalhes_versao": _versao_detalhes(asm)}
+
+@router.get("/votos-detalhados")
+def votos_detalhados(desde: int = 0, pauta_id: str = None, limite: int = Query(5000, ge=1, le=20000), db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
+    """Votos da assembleia ativa com id > `desde`, em ordem de id. `cursor` é o último id entregue."""
+    est = estado.snapshot(db)
+    versao = _versao_detalhes(est.assembleia)
+    tipos = {p.id: p.tipo for p in est.pautas}
+    if pauta_id: tipos = {pauta_id: tipos[pauta_id]} if pauta_id in tipos else {}
+    if not tipos: return RespostaJSON({"votos": [], "cursor": desde, "mais": False, "detalhes_versao": versao})
+    linhas = db.query(models.Voto.id, models.Voto.pauta_id, models.Voto.usuario_id, models.Voto.escolha_str, models.Usuario.nome, models.Usuario.grupo)\
+        .outerjoin(models.Usuario, models.Usuario.id == models.Voto.usuario_id)\
+        .filter(models.Voto.id > desde, models.Voto.pauta_id.in_(list(tipos)))\
+        .order_by(models.Voto.id).limit(limite).all()
+    votos = []
+    for vid, pid, uid, escolha_str, nome, grupo in linhas:
+        val = json.loads(escolha_str) if escolha_str else []
+        v_str = val if tipos[pid] == "SIMPLES" else (", ".join(val) if isinstance(val, list) else str(val))
+        votos.append({"id": vid, "pauta_id": pid, "credencial": uid, "nome": nome or "?", "grupo": grupo or "-", "voto": v_str})
+    return RespostaJSON({"votos": votos, "cursor": linhas[-1].id if linhas else desde, "mais": len(linhas) == limite, "detalhes_versao": versao})
+
+def _admin_valido(token: str) -> bool:
+    db = SessionLocal()
+    try:
+        verificar_admin(None, token, db)
+        return True
+    except HTTPException: return False
+    finally: db.close()
+
+@router.get("/dados-admin/stream")
+def stream_admin(request: Request, token: str = Query(None)):
+    if not _admin_valido(token): raise HTTPException(401, "Invalid")
+    # Reconfere a cada envio: admin removido ou token expirado encerra o stream
+    return stream_estado(request, montar_admin, autorizado=lambda: _admin_valido(token))
+
+@router.post("/pautas", response_model=PautaSaida)
 def add_pauta(d: PautaInput, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
+    asm = estado.snapshot(db).assembleia
     if not asm: raise HTTPException(400, "Sem assembleia")
-    nova = models.Pauta(id=str(uuid.uuid4()), titulo=d.titulo, assembleia_id=asm.id, tipo=d.tipo, max_escolhas=d.max_escolhas, candidatos_str=json.dumps(d.candidatos))
+    nova = models.Pauta(id=str(uuid.uuid4()), titulo=d.titulo, assembleia_id=asm.id, tipo=d.tipo, max_escolhas=d.max_escolhas, candidatos_str=json.dumps(d.candidatos), seq=models.Pauta.proximo_seq(db))
     db.add(nova)
     db.commit()
+    estado.invalidar()
+    publicar()
     return nova
 
 @router.put("/pautas/{id}")
@@ -333,12 +502,15 @@ def edit_pauta(id: str, d: PautaInput, db: Session = Depends(get_db), u: str = D
     if not p: raise HTTPException(404)
     p.titulo = d.titulo; p.tipo = d.tipo; p.max_escolhas = d.max_escolhas; p.candidatos_str = json.dumps(d.candidatos)
     db.commit()
+    invalidar_apuracao(id)
+    estado.invalidar()
+    publicar()
     return {"msg": "ok"}
 
 @router.delete("/pautas/{id}")
 def del_pauta(id: str, db: Session = Depends(get_db), u: str = Depends(verificar_admin)):
     p = db.query(models.Pauta).filter(models.Pauta.id == id).first()
-    if p: db.query(models.Voto).filter(models.Voto.pauta_id == id).delete(); db.delete(p); db.commit(); return {"msg": "ok"}
+    if p: apagar_votos(db, models.Voto.pauta_id == id); db.delete(p); db.commit(); invalidar_apuracao(id); estado.invalidar(); publicar(); return {"msg": "ok"}
     raise HTTPException(404)
 
 @router.post("/pautas/{id}/status")
@@ -348,52 +520,18 @@ def set_status(id: str, d: StatusPauta, db: Session = Depends(get_db), u: str =
     if d.status == "ABERTA": db.query(models.Pauta).filter(models.Pauta.assembleia_id == p.assembleia_id, models.Pauta.status == "ABERTA").update({models.Pauta.status: "ENCERRADA"})
     p.status = d.status
     db.commit()
+    invalidar_pautas()
+    estado.invalidar()
+    publicar()
     return {"msg": "ok"}
 
 @router.get("/exportar")
-def exportar(x_admin_token: str = Header(None), token: str = Query(None), db: Session = Depends(get_db)):
+def exportar(x_admin_token: str = Header(None), token: str = Query(None), formato: str = Query("xlsx"), db: Session = Depends(get_db)):
     verificar_admin(x_admin_token, token, db)
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
+    asm = estado.snapshot(db).assembleia
     tn = asm.titulo if asm else "Relatorio"
-    wb = Workbook()
-    hf = Font(name='Calibri', size=12, bold=True, color="FFFFFF")
-    fill = PatternFill(start_color="002d62", end_color="002d62", fill_type="solid")
-    ca = Alignment(horizontal='center', vertical='center')
-    bd = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws1 = wb.active; ws1.title = "Resumo"
-    ws1.merge_cells('A1:E1'); ws1['A1'].value=f"RELATÓRIO: {tn.upper()}"; ws1['A1'].font=Font(size=14, bold=True, color="002d62"); ws1['A1'].alignment=ca
-    ws1.append(["Ordem", "Pauta", "Tipo", "Status", "Votos"])
-    for c in ws1[2]: c.font=hf; c.fill=fill; c.alignment=ca
-    pautas = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).all() if asm else []
-    for i, p in enumerate(pautas, 1):
-        v_count = db.query(models.Voto).filter(models.Voto.pauta_id == p.id).count()
-        ws1.append([i, p.titulo, p.tipo, p.status, v_count])
-        for cell in ws1[ws1.max_row]: cell.border=bd; cell.alignment=ca
-        
-    ws2 = wb.create_sheet("Detalhamento Votos")
-    ws2.append(["Pauta", "ID", "Nome", "Grupo", "Voto"])
-    for c in ws2[1]: c.font=hf; c.fill=fill; c.alignment=ca
-    users_map = {u.id: u for u in db.query(models.Usuario).all()}
-    for p in pautas:
-        votos = db.query(models.Voto).filter(models.Voto.pauta_id == p.id).all()
-        for v in votos:
-            usr = users_map.get(v.usuario_id)
-            val = json.loads(v.escolha_str)
-            vf = val.upper() if p.tipo == "SIMPLES" and val != "favor" else ("A FAVOR" if val=="favor" else str(val))
-            if isinstance(val, list): vf = ", ".join(val)
-            ws2.append([p.titulo, v.usuario_id, usr.nome if usr else "?", f"GE {usr.grupo if usr else '-'}", vf])
-            for cell in ws2[ws2.max_row]: cell.border=bd
-    ws2.column_dimensions['A'].width=40; ws2.column_dimensions['C'].width=35; ws2.column_dimensions['E'].width=50
-    
-    ws3 = wb.create_sheet("Credenciados")
-    ws3.append(["ID", "Nome", "Grupo", "Email", "CPF", "Token", "Check-in"])
-    for c in ws3[1]: c.font=hf; c.fill=fill; c.alignment=ca
-    todos_usuarios = db.query(models.Usuario).all()
-    for u in todos_usuarios:
-        ws3.append([u.id, u.nome, u.grupo, u.email, u.cpf, u.token, "SIM" if u.checkin else "NÃO"])
-        for cell in ws3[ws3.max_row]: cell.border=bd
-    ws3.column_dimensions['B'].width=35; ws3.column_dimensions['D'].width=35; ws3.column_dimensions['E'].width=15
-    
-    buf = io.BytesIO(); wb.save(buf); buf.seek(0)
-    return StreamingResponse(buf, headers={'Content-Disposition': f'attachment; filename="{tn}.xlsx"'}, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
\ No newline at end of file
+    if formato == "csv":
+        return StreamingResponse(gerar_csv_zip(asm.id if asm else None), headers={'Content-Disposition': f'attachment; filename="{tn}.zip"'}, media_type='application/zip')
+    if formato != "xlsx": raise HTTPException(400, "Formato inválido")
+    arq = gerar_xlsx(db, asm)
+    return StreamingResponse(ler_em_blocos(arq), headers={'Content-Disposition': f'attachment; filename="{tn}.xlsx"'}, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
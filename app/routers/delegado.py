@@ -1,29 +1,25 @@
+import zlib
 import secrets
 import json
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel, EmailStr
 from typing import List, Union
-from app.database import get_db
+from app.database import get_db, get_async_db, AsyncSessionLocal, VOTOS_EM_LOTE
 from app import models
-from app.email_utils import enviar_token_email
+from app.models import validar_cpf_algo
+from app import email_utils
+from app.apuracao import obter_apuracao_async, dados_pauta_async, votos_do_delegado, voto_em_memoria, invalidar_pautas, registrar_voto as registrar_apuracao
+from app.eventos import publicar, stream_estado, etag, condicional
+from app.respostas import RespostaJSON, responder
+from app import presenca, ingestao, estado
 
 router = APIRouter(prefix="/api")
 
-# --- VALIDADOR CPF ---
-def validar_cpf_algo(cpf: str) -> bool:
-    numbers = [int(digit) for digit in cpf if digit.isdigit()]
-    if len(numbers) != 11: return False
-    if len(set(numbers)) == 1: return False
-    sum_prod = sum(a*b for a, b in zip(numbers[0:9], range(10, 1, -1)))
-    expected = (sum_prod * 10 % 11) % 10
-    if numbers[9] != expected: return False
-    sum_prod = sum(a*b for a, b in zip(numbers[0:10], range(11, 1, -1)))
-    expected = (sum_prod * 10 % 11) % 10
-    if numbers[10] != expected: return False
-    return True
-
 # --- MODELOS ---
 class LoginRequest(BaseModel):
     token: str
@@ -46,9 +42,9 @@ class HeartbeatInput(BaseModel):
 # --- ROTAS ---
 
 @router.post("/login")
-def login_delegado(dados: LoginRequest, db: Session = Depends(get_db)):
+async def login_delegado(dados: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     token_input = dados.token.strip().upper()
-    user = db.query(models.Usuario).filter(models.Usuario.token == token_input).first()
+    user = (await db.execute(select(models.Usuario).where(models.Usuario.token == token_input))).scalars().first()
     
     if not user:
         raise HTTPException(404, "Código de acesso inválido.")
@@ -57,24 +53,22 @@ def login_delegado(dados: LoginRequest, db: Session = Depends(get_db)):
     if not validar_cpf_algo(dados.cpf):
         raise HTTPException(400, "CPF inválido.")
 
-    cpf_digitado = "".join(filter(str.isdigit, dados.cpf))
-    cpf_salvo = "".join(filter(str.isdigit, user.cpf or ""))
-    
-    if cpf_digitado != cpf_salvo:
+    # cpf_digits só fica vazio em CPFs repetidos de bases antigas; aí compara o texto salvo
+    if models.so_digitos(dados.cpf) != (user.cpf_digits or models.so_digitos(user.cpf)):
         raise HTTPException(401, "O CPF informado não corresponde a este código.")
 
     if not user.checkin:
         raise HTTPException(403, "Delegado não credenciado. Dirija-se à mesa.")
 
     # Concorrência
-    if user.last_seen:
+    last_seen = presenca.obter(user.token, user.last_seen)
+    if last_seen:
         agora = datetime.utcnow()
         tempo_limite = agora - timedelta(seconds=15)
-        if user.last_seen > tempo_limite:
+        if last_seen > tempo_limite:
             raise HTTPException(409, "Sessão ativa em outro dispositivo.")
 
-    user.last_seen = datetime.utcnow()
-    db.commit()
+    presenca.registrar(user.token)
 
     # --- RETORNA DICIONÁRIO PARA GARANTIR CAMPOS ---
     return {
@@ -87,63 +81,49 @@ def login_delegado(dados: LoginRequest, db: Session = Depends(get_db)):
     }
 
 @router.post("/heartbeat")
-def heartbeat(dados: HeartbeatInput, db: Session = Depends(get_db)):
-    user = db.query(models.Usuario).filter(models.Usuario.token == dados.token).first()
-    if user:
-        user.last_seen = datetime.utcnow()
-        db.commit()
+async def heartbeat(dados: HeartbeatInput, db: AsyncSession = Depends(get_async_db)):
+    # Só consulta o banco para tokens ainda não vistos por este processo
+    if presenca.conhecido(dados.token) or (await db.execute(select(models.Usuario.id).where(models.Usuario.token == dados.token))).first():
+        presenca.registrar(dados.token)
     return {"status": "alive"}
 
 @router.post("/logout-delegado")
 def logout_delegado(dados: HeartbeatInput, db: Session = Depends(get_db)):
-    user = db.query(models.Usuario).filter(models.Usuario.token == dados.token).first()
-    if user:
-        user.last_seen = datetime.utcnow() - timedelta(minutes=10)
-        db.commit()
+    if presenca.conhecido(dados.token) or db.query(models.Usuario.id).filter(models.Usuario.token == dados.token).first():
+        presenca.registrar(dados.token, datetime.utcnow() - timedelta(minutes=10))
     return {"status": "logged_out"}
 
+@router.get("/estado")
+def get_estado():
+    """Versão do snapshot de estado: muda a cada mutação de assembleia/pauta."""
+    return {"versao": estado.versao()}
+
 @router.get("/pauta-ativa")
-def get_pauta_ativa(credencial: str = None, db: Session = Depends(get_db)):
-    user = db.query(models.Usuario).filter(models.Usuario.token == credencial).first()
-    
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
+async def get_pauta_ativa(request: Request, response: Response, credencial: str = None, db: AsyncSession = Depends(get_async_db)):
+    # O voto do próprio delegado faz parte do payload: o ETag é por credencial
+    tag = etag(format(zlib.crc32((credencial or "").encode()), "x"))
+    nao_mudou = condicional(request, response, tag)
+    if nao_mudou: return nao_mudou
+    return responder(await montar_pauta_ativa(credencial, db=db), response)
+
+async def _id_do_token(db: AsyncSession, credencial: str):
+    return (await db.execute(select(models.Usuario.id).where(models.Usuario.token == credencial))).scalar() if credencial else None
+
+async def montar_pauta_ativa(credencial: str, db: AsyncSession):
+    return await _pauta_ativa(db, await _id_do_token(db, credencial))
+
+async def _pauta_ativa(db: AsyncSession, user_id: str = None):
+    est = await estado.snapshot_async(db)
+    asm = est.assembleia
     if not asm: return {"evento": "Escoteiros", "pauta": None}
 
-    pauta = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id, models.Pauta.status == "ABERTA").first()
-    if not pauta:
-        pauta = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).order_by(models.Pauta.id.desc()).first()
-
+    pauta = est.pauta_atual
     if not pauta: return {"evento": asm.titulo, "pauta": None}
 
-    votos_db = db.query(models.Voto).filter(models.Voto.pauta_id == pauta.id).all()
-    candidatos_lista = json.loads(pauta.candidatos_str) if pauta.candidatos_str else []
-    
-    if pauta.tipo == "SIMPLES":
-        contagem = {"favor": 0, "contra": 0, "abstencao": 0}
-        for v in votos_db:
-            val = json.loads(v.escolha_str)
-            if val in contagem: contagem[val] += 1
-    else:
-        contagem = {c: 0 for c in candidatos_lista}
-        for v in votos_db:
-            escolhas = json.loads(v.escolha_str)
-            if isinstance(escolhas, list):
-                for c in escolhas:
-                    if c in contagem: contagem[c] += 1
-            elif escolhas in contagem:
-                contagem[escolhas] += 1
-
-    pode_votar = True
-    meus_votos = []
-    
-    if user:
-        voto_existente = db.query(models.Voto).filter(models.Voto.pauta_id == pauta.id, models.Voto.usuario_id == user.id).first()
-        if voto_existente:
-            pode_votar = False
-            raw_voto = json.loads(voto_existente.escolha_str)
-            meus_votos = raw_voto if isinstance(raw_voto, list) else [raw_voto]
+    candidatos_lista = pauta.candidatos
+    apuracao = await obter_apuracao_async(db, pauta, usuario_id=user_id)
 
-    return {
+    return _com_meu_voto({
         "evento": asm.titulo,
         "pauta": {
             "id": pauta.id,
@@ -152,67 +132,111 @@ def get_pauta_ativa(credencial: str = None, db: Session = Depends(get_db)):
             "tipo": pauta.tipo,
             "candidatos": candidatos_lista,
             "max_escolhas": pauta.max_escolhas,
-            "total_votos": len(votos_db)
+            "total_votos": apuracao["total"]
         },
-        "meus_votos": meus_votos,
-        "pode_votar": pode_votar,
-        "resultados": contagem
-    }
+        "meus_votos": [],
+        "pode_votar": True,
+        "resultados": apuracao["contagem"]
+    }, apuracao["meu_voto"])
+
+def _com_meu_voto(payload: dict, voto) -> dict:
+    if voto is None: return payload
+    return {**payload, "pode_votar": False, "meus_votos": voto if isinstance(voto, list) else [voto]}
+
+async def _pauta_ativa_geral(db: AsyncSession):
+    return await _pauta_ativa(db)
+
+@router.get("/pauta-ativa/stream")
+async def stream_pauta_ativa(request: Request, credencial: str = None):
+    # O token é resolvido uma vez na conexão; a cada versão todos os streams
+    # recebem o mesmo payload e só o voto do delegado é encaixado (da memória)
+    async with AsyncSessionLocal() as db: user_id = await _id_do_token(db, credencial)
+
+    async def ajustar(payload: dict) -> dict:
+        if user_id is None or not payload["pauta"]: return payload
+        pauta_id = payload["pauta"]["id"]
+        em_memoria, voto = voto_em_memoria(pauta_id, user_id)
+        if not em_memoria:
+            async with AsyncSessionLocal() as db:
+                escolha_str = (await db.execute(select(models.Voto.escolha_str).where(models.Voto.pauta_id == pauta_id, models.Voto.usuario_id == user_id))).scalar()
+            voto = (json.loads(escolha_str) if escolha_str else []) if escolha_str is not None else None
+        return _com_meu_voto(payload, voto)
+
+    return stream_estado(request, _pauta_ativa_geral, ajustar)
+
+OPCOES_SIMPLES = {"favor", "contra", "abstencao"}
 
 @router.post("/votar")
-def registrar_voto(dados: VotoRequest, db: Session = Depends(get_db)):
-    user = db.query(models.Usuario).filter(models.Usuario.token == dados.token).first()
+async def registrar_voto(dados: VotoRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(models.Usuario.id, models.Usuario.checkin).where(models.Usuario.token == dados.token))).first()
     if not user: raise HTTPException(401, "Token inválido")
     if not user.checkin: raise HTTPException(403, "Check-in necessário")
 
-    pauta = db.query(models.Pauta).filter(models.Pauta.id == dados.pauta_id).first()
-    if not pauta or pauta.status != "ABERTA": raise HTTPException(400, "Votação fechada")
-    
-    existente = db.query(models.Voto).filter(models.Voto.pauta_id == pauta.id, models.Voto.usuario_id == user.id).first()
-    if existente: raise HTTPException(400, "Já votou")
+    pauta = await dados_pauta_async(db, dados.pauta_id)
+    if not pauta or pauta["status"] != "ABERTA": raise HTTPException(400, "Votação fechada")
 
-    if pauta.tipo == "ELEICAO":
+    # Mesma regra da apuração: tudo que não é SIMPLES é votação por candidatos
+    if pauta["tipo"] != "SIMPLES":
         if not isinstance(dados.opcao, list): raise HTTPException(400, "Erro formato lista")
-        if len(dados.opcao) > pauta.max_escolhas: raise HTTPException(400, "Limite excedido")
-        validos = json.loads(pauta.candidatos_str)
+        if len(dados.opcao) > pauta["max_escolhas"]: raise HTTPException(400, "Limite excedido")
+        if len(set(dados.opcao)) != len(dados.opcao): raise HTTPException(400, "Candidato repetido")
         for c in dados.opcao:
-            if c not in validos: raise HTTPException(400, f"Inválido: {c}")
-
-    novo_voto = models.Voto(
-        pauta_id=pauta.id,
-        usuario_id=user.id,
-        escolha_str=json.dumps(dados.opcao)
-    )
-    db.add(novo_voto)
-    db.commit()
+            if c not in pauta["candidatos"]: raise HTTPException(400, f"Inválido: {c}")
+    elif not isinstance(dados.opcao, str) or dados.opcao not in OPCOES_SIMPLES:
+        raise HTTPException(400, "Opção inválida")
+
+    # O índice único votos(pauta_id, usuario_id) barra o segundo voto, inclusive toques simultâneos
+    escolha_str = json.dumps(dados.opcao)
+    try:
+        if VOTOS_EM_LOTE:
+            await db.close()  # devolve a conexão ao pool enquanto espera o lote; o escritor usa outra
+            inseridos = await ingestao.registrar_async(pauta["id"], user.id, escolha_str)
+        else:
+            linha = {"pauta_id": pauta["id"], "usuario_id": user.id, "escolha_str": escolha_str}
+            inseridos = len(await db.run_sync(ingestao.inserir_votos, [linha]))
+            await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        inseridos = 0
+    except ingestao.FilaCheia:
+        raise HTTPException(503, "Servidor ocupado. Tente novamente.")
+    if not inseridos:
+        # Recusado pelo banco: ou já votou, ou a pauta foi encerrada por outro worker (o cache local não viu)
+        if voto_em_memoria(pauta["id"], user.id)[1] is not None: raise HTTPException(400, "Já votou")
+        status = (await db.execute(select(models.Pauta.status).where(models.Pauta.id == pauta["id"]))).scalar()
+        if status != "ABERTA":
+            invalidar_pautas()
+            raise HTTPException(400, "Votação fechada")
+        raise HTTPException(400, "Já votou")
+    registrar_apuracao(pauta["id"], user.id, dados.opcao)
+    publicar()
     
     return {"msg": "Voto registrado"}
 
 @router.get("/historico")
 def get_historico(credencial: str, db: Session = Depends(get_db)):
-    user = db.query(models.Usuario).filter(models.Usuario.token == credencial).first()
+    user = db.query(models.Usuario.id).filter(models.Usuario.token == credencial).first()
     if not user: return []
     
-    asm = db.query(models.Assembleia).filter(models.Assembleia.ativa == True).first()
-    if not asm: return []
+    est = estado.snapshot(db)
+    if not est.assembleia: return []
 
-    pautas = db.query(models.Pauta).filter(models.Pauta.assembleia_id == asm.id).all()
-    pautas.reverse() 
+    pautas = est.pautas[::-1]
+    # Votos do delegado vindos da apuração em memória: sem consulta por pauta
+    votos = votos_do_delegado(db, pautas, user.id)
     
     res = []
     for p in pautas:
-        voto = db.query(models.Voto).filter(models.Voto.pauta_id == p.id, models.Voto.usuario_id == user.id).first()
-        if voto or p.status == "ENCERRADA":
-            v_val = json.loads(voto.escolha_str) if voto else []
+        if p.id in votos or p.status == "ENCERRADA":
+            v_val = votos.get(p.id, [])
             v_fmt = v_val if isinstance(v_val, list) else ([v_val] if v_val else [])
             res.append({"titulo": p.titulo, "status": p.status, "votos": v_fmt})
-    return res
+    return RespostaJSON(res)
 
 # === AUTO-CADASTRO ATUALIZADO ===
 @router.post("/auto-cadastro")
-async def auto_cadastro(
+def auto_cadastro(
     dados: CadastroInput, 
-    background_tasks: BackgroundTasks, 
     db: Session = Depends(get_db)
 ):
     if not dados.nome or not dados.grupo or not dados.cpf or not dados.email:
@@ -221,40 +245,41 @@ async def auto_cadastro(
     if not validar_cpf_algo(dados.cpf):
         raise HTTPException(400, "CPF inválido. Verifique os números.")
 
-    cpf_limpo = "".join(filter(str.isdigit, dados.cpf))
+    cpf_limpo = models.so_digitos(dados.cpf)
 
-    # Verifica CPF duplicado
-    todos = db.query(models.Usuario).all()
-    for u in todos:
-        if "".join(filter(str.isdigit, u.cpf)) == cpf_limpo:
-            raise HTTPException(400, "CPF já cadastrado")
-
-    # Gera ID
-    existentes = [u for u in todos if u.grupo == dados.grupo]
-    prox = 1
-    if existentes:
-        try:
-            ids = [int(u.id.split('-')[1]) for u in existentes]
-            prox = max(ids) + 1
-        except: prox = len(existentes) + 1
-    
-    user_id = f"{dados.grupo}-{prox}"
+    # Verifica CPF duplicado (índice único em cpf_digits)
+    if db.query(models.Usuario.id).filter(models.Usuario.cpf_digits == cpf_limpo).first():
+        raise HTTPException(400, "CPF já cadastrado")
 
     # Gera Token
     while True:
         token = secrets.token_hex(3).upper()
-        if not db.query(models.Usuario).filter(models.Usuario.token == token).first():
+        if not db.query(models.Usuario.id).filter(models.Usuario.token == token).first():
             break
 
-    # Salva com Email
-    novo = models.Usuario(
-        id=user_id, nome=dados.nome.strip().title(), grupo=dados.grupo,
-        cpf=dados.cpf, email=dados.email, token=token, checkin=False
-    )
-    db.add(novo)
-    db.commit()
+    # Salva o delegado e o registro do e-mail no mesmo commit; se outro cadastro
+    # simultâneo pegar o mesmo ID, tenta o próximo
+    for _ in range(5):
+        seq = models.Usuario.proximo_seq(db, dados.grupo)
+        user_id = f"{dados.grupo}-{seq}"
+        novo = models.Usuario(
+            id=user_id, nome=dados.nome.strip().title(), grupo=dados.grupo, seq=seq,
+            cpf=dados.cpf, email=dados.email, token=token, checkin=False
+        )
+        db.add(novo)
+        try:
+            envio = email_utils.registrar_cadastro(db, user_id, dados.email)
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if db.query(models.Usuario.id).filter(models.Usuario.cpf_digits == cpf_limpo).first():
+                raise HTTPException(400, "CPF já cadastrado")
+    else:
+        raise HTTPException(409, "Não foi possível gerar o ID. Tente novamente.")
+    publicar()
 
-    # Envia email em segundo plano
-    background_tasks.add_task(enviar_token_email, dados.email, dados.nome, token, user_id)
+    # Envia email em segundo plano (fila própria, fora do event loop)
+    email_utils.enfileirar_cadastro(envio, dados.nome, token)
 
     return {"msg": "Sucesso", "token": token, "id": user_id}
\ No newline at end of file
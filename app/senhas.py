@@ -0,0 +1,53 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+
+# --- HASH DE SENHAS FORA DO THREADPOOL ---
+# bcrypt leva dezenas de ms de CPU por chamada. Rodar isso nas threads do
+# FastAPI disputa as mesmas vagas usadas pelos endpoints dos delegados; aqui o
+# trabalho vai para um pool próprio com BCRYPT_PROCESSOS processos (spawn, que
+# só importa este módulo, sem engine nem app).
+
+BCRYPT_PROCESSOS = int(os.getenv("BCRYPT_PROCESSOS", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _cortar(senha: str) -> str:
+    return senha[:70] if len(senha) > 70 else senha
+
+def gerar_hash(senha: str) -> str:
+    return pwd_context.hash(_cortar(senha))
+
+def conferir(senha: str, senha_hash: str) -> bool:
+    try: return pwd_context.verify(_cortar(senha), senha_hash)
+    except ValueError: return False
+
+_pool = None
+_lock = threading.Lock()
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(BCRYPT_PROCESSOS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+async def gerar_hash_async(senha: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor(), gerar_hash, senha)
+
+async def conferir_async(senha: str, senha_hash: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_executor(), conferir, senha, senha_hash)
+
+def gerar_hash_no_pool(senha: str) -> str:
+    """Versão bloqueante para rotas síncronas (a thread só espera, o CPU fica no pool)."""
+    return _executor().submit(gerar_hash, senha).result()
+
+def parar():
+    global _pool
+    with _lock:
+        if _pool is not None: _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,74 @@
+"""Rajada de votos: N delegados votam ao mesmo tempo na mesma pauta.
+
+Cada delegado dispara `--toques` requisições simultâneas (toque duplo no
+celular), para medir latência de /api/votar e verificar que só um voto por
+delegado é aceito.
+
+    python benchmarks/burst_votos.py --delegados 800
+    python benchmarks/burst_votos.py --delegados 800 --repo /tmp/checkout-antigo
+    python benchmarks/burst_votos.py --delegados 800 --lote   # VOTOS_EM_LOTE=1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comum import RAIZ, servidor, requisicao, percentis, criar_esquema, semear_votacao
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--delegados", type=int, default=400)
+    ap.add_argument("--toques", type=int, default=2)
+    ap.add_argument("--concorrencia", type=int, default=64)
+    ap.add_argument("--repo", default=RAIZ, help="checkout do app a medir")
+    ap.add_argument("--lote", action="store_true", help="liga a ingestão em lote (VOTOS_EM_LOTE=1)")
+    ap.add_argument("--saida", help="grava o resultado em JSON")
+    args = ap.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    db_url = f"sqlite:///{os.path.join(pasta, 'bench.db')}"
+    criar_esquema(db_url, args.repo)
+    pauta_id, tokens = semear_votacao(db_url, args.delegados)
+
+    latencias, status = [], {}
+    lock = threading.Lock()
+    with servidor(db_url, args.repo, {"VOTOS_EM_LOTE": "1" if args.lote else "0"}) as base:
+        largada = threading.Event()
+
+        def votar(token):
+            largada.wait()
+            st, dt, _ = requisicao("POST", base + "/api/votar", {"token": token, "pauta_id": pauta_id, "opcao": "favor"})
+            with lock:
+                latencias.append(dt)
+                status[st] = status.get(st, 0) + 1
+
+        with ThreadPoolExecutor(args.concorrencia) as pool:
+            futuros = [pool.submit(votar, t) for t in tokens for _ in range(args.toques)]
+            t0 = time.perf_counter()
+            largada.set()
+            for f in futuros: f.result()
+            duracao = time.perf_counter() - t0
+
+    engine = create_engine(db_url)
+    with engine.connect() as conn:
+        gravados = conn.execute(text("SELECT COUNT(*) FROM votos")).scalar()
+    engine.dispose()
+
+    resultado = {
+        "repo": os.path.abspath(args.repo), "delegados": args.delegados, "toques": args.toques, "lote": args.lote,
+        "votar": percentis(latencias), "status": status,
+        "duracao_s": round(duracao, 3), "requisicoes_por_s": round(len(latencias) / duracao, 1),
+        "votos_gravados": gravados, "votos_duplicados": gravados - args.delegados,
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as f: json.dump(resultado, f, indent=2)
+
+if __name__ == "__main__":
+    main()
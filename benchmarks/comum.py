@@ -0,0 +1,115 @@
+"""Utilitários compartilhados pelos benchmarks.
+
+Sobem o app com uvicorn num subprocesso apontando para um banco descartável e
+semeiam dados com SQL simples (só as colunas do esquema original), para que o
+mesmo script rode contra checkouts antigos (`--repo`) e compare antes/depois.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import subprocess
+import urllib.request
+import urllib.error
+from contextlib import contextmanager
+from sqlalchemy import create_engine, text
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def servidor(db_url: str, repo: str = RAIZ, env_extra: dict = None, workers: int = 1, log: str = None, com_processo: bool = False):
+    """Sobe o app; com `log`, o stderr do uvicorn (tracebacks) vai para esse arquivo.
+
+    Entrega a URL base, ou (base, Popen) com `com_processo`.
+    """
+    porta = porta_livre()
+    env = dict(os.environ, DATABASE_URL=db_url, **(env_extra or {}))
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(porta), "--log-level", "warning"]
+    if workers > 1: cmd += ["--workers", str(workers)]
+    erros = open(log, "ab") if log else None
+    proc = subprocess.Popen(cmd, cwd=repo, env=env, stdout=subprocess.DEVNULL, stderr=erros)
+    base = f"http://127.0.0.1:{porta}"
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + "/api/telao-dados", timeout=1)
+                break
+            except Exception:
+                if proc.poll() is not None: raise RuntimeError("servidor não subiu")
+                time.sleep(0.1)
+        yield (base, proc) if com_processo else base
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        if erros: erros.close()
+
+def requisicao(metodo: str, url: str, corpo=None, headers: dict = None, timeout: float = 60):
+    """Retorna (status, segundos, corpo_bytes)."""
+    dados = json.dumps(corpo).encode() if corpo is not None else None
+    req = urllib.request.Request(url, data=dados, method=metodo, headers={"Content-Type": "application/json", **(headers or {})})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            body = r.read()
+            return r.status, time.perf_counter() - t0, body
+    except urllib.error.HTTPError as e:
+        return e.code, time.perf_counter() - t0, e.read()
+    except Exception as e:
+        return 0, time.perf_counter() - t0, str(e).encode()
+
+def memoria_kb(pid: int, campo: str = "VmRSS"):
+    """Memória do processo em kB lida de /proc (None fora do Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for l in f:
+                if l.startswith(campo + ":"): return int(l.split()[1])
+    except OSError: return None
+
+def zerar_pico(pid: int) -> bool:
+    """Reinicia o VmHWM (pico de RSS) do processo; False se o kernel não permitir."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError: return False
+
+def percentis(amostras: list) -> dict:
+    if not amostras: return {"n": 0}
+    xs = sorted(amostras)
+    pct = lambda p: xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+    return {"n": len(xs), "p50_ms": round(pct(50) * 1000, 2), "p95_ms": round(pct(95) * 1000, 2),
+            "p99_ms": round(pct(99) * 1000, 2), "max_ms": round(xs[-1] * 1000, 2)}
+
+def gerar_cpf(rnd: random.Random) -> str:
+    """CPF com dígitos verificadores válidos."""
+    while True:
+        n = [rnd.randint(0, 9) for _ in range(9)]
+        for k in (10, 11):
+            n.append(sum(a * b for a, b in zip(n, range(k, 1, -1))) * 10 % 11 % 10)
+        if len(set(n)) > 1: return "".join(map(str, n))
+
+def criar_esquema(db_url: str, repo: str = RAIZ):
+    """Cria as tabelas com os models do checkout em `repo` (sobe e derruba o app)."""
+    with servidor(db_url, repo): pass
+
+def semear_votacao(db_url: str, delegados: int, status: str = "ABERTA", tipo: str = "SIMPLES", candidatos: list = None):
+    """Assembleia ativa + uma pauta + `delegados` credenciados. Retorna (pauta_id, tokens)."""
+    engine = create_engine(db_url)
+    tokens = [f"T{i:05d}" for i in range(delegados)]
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO assembleias (id, titulo, ativa) VALUES ('asm-bench', 'Benchmark', :t)"), {"t": True})
+        conn.execute(text(
+            "INSERT INTO pautas (id, titulo, assembleia_id, status, tipo, max_escolhas, candidatos_str) "
+            "VALUES ('pauta-bench', 'Pauta', 'asm-bench', :s, :tipo, :m, :c)"),
+            {"s": status, "tipo": tipo, "m": 1 if tipo == "SIMPLES" else 3, "c": json.dumps(candidatos or [])})
+        conn.execute(text(
+            "INSERT INTO usuarios (id, token, nome, grupo, cpf, email, checkin) VALUES (:id, :token, :nome, :grupo, '', '', :ck)"),
+            [{"id": f"{i % 50}-{i}", "token": t, "nome": f"Delegado {i}", "grupo": str(i % 50), "ck": True} for i, t in enumerate(tokens)])
+    engine.dispose()
+    return "pauta-bench", tokens
@@ -0,0 +1,233 @@
+"""Dia de assembleia: carga realista contra o app local, com relatório em JSON.
+
+Reproduz o uso de um dia de votação contra um app subido aqui mesmo:
+
+- `--delegados` delegados entram aos poucos (`--rampa`) por /api/login, mandam
+  heartbeat a cada 5 s e consultam /api/pauta-ativa a cada 2 s (com
+  If-None-Match, como o delegado.html);
+- quando o admin abre uma pauta, cada delegado vota após 0..`--reacao` s;
+- um telão consulta /api/telao-dados e `--paineis` admins consultam
+  /api/dados-admin a cada 2 s;
+- o primeiro painel abre e encerra `--pautas` pautas em sequência.
+
+O relatório traz vazão e p50/p95/p99 por endpoint, taxa de erro e quantos
+"database is locked" apareceram no log do servidor. Rode com `--saida` em
+duas versões e compare os arquivos.
+
+    python benchmarks/dia_assembleia.py --delegados 300
+    python benchmarks/dia_assembleia.py --delegados 300 --repo /tmp/checkout-antigo --saida antes.json
+    python benchmarks/dia_assembleia.py --database-url postgresql://localhost/assembleia_bench
+
+Requer httpx. Com `--database-url` o banco precisa estar vazio (o script cria
+e semeia as tabelas).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from sqlalchemy import create_engine, text
+
+try: import httpx
+except ImportError: raise SystemExit("instale o httpx para rodar este benchmark: pip install httpx")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comum import RAIZ, servidor, percentis, criar_esquema, gerar_cpf
+
+SENHA = "senha-do-benchmark"
+HEARTBEAT_S = 5
+POLL_S = 2
+
+def semear(db_url: str, delegados: int, pautas: int) -> list:
+    """Assembleia ativa, `pautas` pautas AGUARDANDO (a última é eleição) e delegados credenciados."""
+    engine = create_engine(db_url)
+    rnd = random.Random(42)
+    credenciais = [(f"D{i:05d}", gerar_cpf(rnd)) for i in range(delegados)]
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM usuarios")).scalar(): raise SystemExit("o banco precisa estar vazio")
+        conn.execute(text("INSERT INTO assembleias (id, titulo, ativa) VALUES ('asm-dia', 'Dia de Assembleia', :t)"), {"t": True})
+        for i in range(pautas):
+            eleicao = i == pautas - 1
+            conn.execute(text(
+                "INSERT INTO pautas (id, titulo, assembleia_id, status, tipo, max_escolhas, candidatos_str) "
+                "VALUES (:id, :titulo, 'asm-dia', 'AGUARDANDO', :tipo, :m, :c)"),
+                {"id": f"pauta-{i}", "titulo": f"Pauta {i + 1}", "tipo": "ELEICAO" if eleicao else "SIMPLES",
+                 "m": 3 if eleicao else 1, "c": json.dumps([f"Chapa {c}" for c in "ABCDE"] if eleicao else [])})
+        conn.execute(text(
+            "INSERT INTO usuarios (id, token, nome, grupo, cpf, email, checkin) VALUES (:id, :token, :nome, :grupo, :cpf, '', :ck)"),
+            [{"id": f"{i % 60}-{i}", "token": t, "nome": f"Delegado {i}", "grupo": str(i % 60), "cpf": c, "ck": True}
+             for i, (t, c) in enumerate(credenciais)])
+    engine.dispose()
+    return credenciais
+
+class Carga:
+    def __init__(self, cliente: httpx.AsyncClient, fim: float):
+        self.cliente = cliente
+        self.fim = fim
+        self.amostras = {}  # endpoint -> [(status, segundos)]
+        self.votos_aceitos = 0
+
+    async def chamar(self, nome: str, metodo: str, url: str, corpo=None, headers: dict = None):
+        t0 = time.perf_counter()
+        try:
+            r = await self.cliente.request(metodo, url, json=corpo, headers=headers)
+            st, resp = r.status_code, r
+        except httpx.HTTPError:
+            st, resp = 0, None
+        self.amostras.setdefault(nome, []).append((st, time.perf_counter() - t0))
+        return st, resp
+
+    def ativo(self) -> bool:
+        return time.perf_counter() < self.fim
+
+    async def consultar(self, nome: str, url: str, etag: list, headers: dict = None):
+        """GET condicional: devolve o JSON novo ou None se não mudou/falhou."""
+        h = dict(headers or {})
+        if etag[0]: h["If-None-Match"] = etag[0]
+        st, r = await self.chamar(nome, "GET", url, headers=h)
+        if st != 200: return None
+        etag[0] = r.headers.get("etag")
+        return r.json()
+
+    async def delegado(self, token: str, cpf: str, rampa: float, reacao: float):
+        await asyncio.sleep(random.uniform(0, rampa))
+        st, _ = await self.chamar("login", "POST", "/api/login", {"token": token, "cpf": cpf})
+        if st != 200: return
+        etag, votadas, proximo_hb = [None], set(), time.perf_counter() + HEARTBEAT_S
+        while self.ativo():
+            ciclo = time.perf_counter()
+            dados = await self.consultar("pauta-ativa", f"/api/pauta-ativa?credencial={token}", etag)
+            p = dados and dados.get("pauta")
+            if p and p["status"] == "ABERTA" and dados.get("pode_votar") and p["id"] not in votadas:
+                votadas.add(p["id"])
+                asyncio.create_task(self.votar(token, p, reacao))
+            if time.perf_counter() >= proximo_hb:
+                proximo_hb += HEARTBEAT_S
+                await self.chamar("heartbeat", "POST", "/api/heartbeat", {"token": token})
+            await asyncio.sleep(max(0, POLL_S - (time.perf_counter() - ciclo)))
+
+    async def votar(self, token: str, pauta: dict, reacao: float):
+        await asyncio.sleep(random.uniform(0, reacao))
+        opcao = random.sample(pauta["candidatos"], min(pauta["max_escolhas"], len(pauta["candidatos"]))) \
+            if pauta["tipo"] == "ELEICAO" else random.choice(["favor", "contra", "abstencao"])
+        st, _ = await self.chamar("votar", "POST", "/api/votar", {"token": token, "pauta_id": pauta["id"], "opcao": opcao})
+        if st == 200: self.votos_aceitos += 1
+
+    async def telao(self):
+        etag = [None]
+        while self.ativo():
+            await self.consultar("telao-dados", "/api/telao-dados", etag)
+            await asyncio.sleep(POLL_S)
+
+    async def painel(self, token_admin: str):
+        etag = [None]
+        while self.ativo():
+            await self.consultar("dados-admin", "/api/dados-admin", etag, {"x-admin-token": token_admin})
+            await asyncio.sleep(POLL_S)
+
+    async def conduzir(self, token_admin: str, pautas: int, inicio: float, votacao: float, intervalo: float):
+        """Abre e encerra as pautas em sequência, como a mesa faria."""
+        h = {"x-admin-token": token_admin}
+        await asyncio.sleep(inicio)
+        for i in range(pautas):
+            await self.chamar("admin-status", "POST", f"/api/pautas/pauta-{i}/status", {"status": "ABERTA"}, h)
+            await asyncio.sleep(votacao)
+            await self.chamar("admin-status", "POST", f"/api/pautas/pauta-{i}/status", {"status": "ENCERRADA"}, h)
+            await asyncio.sleep(intervalo)
+
+async def medir_atraso(carga: Carga, atrasos: list):
+    # Se o próprio cliente não dá conta, as latências medidas incluem essa fila
+    while carga.ativo():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.1)
+        atrasos.append(time.perf_counter() - t0 - 0.1)
+
+async def executar(base: str, args, credenciais: list) -> dict:
+    duracao = args.rampa + args.pautas * (args.votacao + args.intervalo) + 5
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=60) as cliente:
+        r = await cliente.post("/api/admin/login", json={"usuario": "admin", "senha": SENHA})
+        if r.status_code != 200: raise SystemExit(f"login do admin falhou: {r.status_code} {r.text}")
+        token_admin = r.json()["token"]
+
+        inicio = time.perf_counter()
+        carga = Carga(cliente, inicio + duracao)
+        atrasos = []
+        tarefas = [carga.delegado(t, c, args.rampa, args.reacao) for t, c in credenciais]
+        tarefas += [carga.telao() for _ in range(args.teloes)]
+        tarefas += [carga.painel(token_admin) for _ in range(args.paineis)]
+        tarefas += [carga.conduzir(token_admin, args.pautas, args.rampa + 5, args.votacao, args.intervalo), medir_atraso(carga, atrasos)]
+        await asyncio.gather(*tarefas)
+        segundos = time.perf_counter() - inicio
+
+    endpoints, total, erros = {}, 0, 0
+    for nome, xs in sorted(carga.amostras.items()):
+        status = {}
+        for st, _ in xs: status[st] = status.get(st, 0) + 1
+        # 304 é sucesso do GET condicional; 400 "Já votou"/409 sessão ativa são respostas de negócio
+        falhas = sum(n for st, n in status.items() if st == 0 or st >= 500)
+        endpoints[nome] = {**percentis([dt for _, dt in xs]), "req_por_s": round(len(xs) / segundos, 1),
+                           "status": {str(st): n for st, n in sorted(status.items())}, "falhas": falhas}
+        total += len(xs); erros += falhas
+    return {
+        "segundos": round(segundos, 1), "endpoints": endpoints,
+        "total": {"requisicoes": total, "req_por_s": round(total / segundos, 1), "falhas": erros, "taxa_falhas": round(erros / total, 5) if total else 0},
+        "votos_aceitos": carga.votos_aceitos, "atraso_cliente": percentis(atrasos),
+    }
+
+def contar_locked(log: str) -> int:
+    with open(log, errors="replace") as f:
+        return sum(1 for l in f if l.startswith("sqlalchemy.exc.OperationalError") and "database is locked" in l)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--delegados", type=int, default=200)
+    ap.add_argument("--rampa", type=float, default=20, help="segundos até todos os delegados entrarem")
+    ap.add_argument("--pautas", type=int, default=3)
+    ap.add_argument("--votacao", type=float, default=20, help="segundos com cada pauta aberta")
+    ap.add_argument("--intervalo", type=float, default=10, help="segundos entre encerrar uma pauta e abrir a próxima")
+    ap.add_argument("--reacao", type=float, default=8, help="cada delegado vota entre 0 e N s após ver a pauta aberta")
+    ap.add_argument("--teloes", type=int, default=1)
+    ap.add_argument("--paineis", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=1, help="workers do uvicorn")
+    ap.add_argument("--database-url", help="banco vazio a usar (padrão: SQLite temporário)")
+    ap.add_argument("--repo", default=RAIZ, help="checkout do app a medir")
+    ap.add_argument("--env", action="append", default=[], help="VAR=valor extra para o servidor (repetível)")
+    ap.add_argument("--saida", help="grava o relatório em JSON")
+    args = ap.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    db_url = args.database_url or f"sqlite:///{os.path.join(pasta, 'bench.db')}"
+    log = os.path.join(pasta, "servidor.log")
+    env = {"ADMIN_PASSWORD": SENHA, **dict(e.split("=", 1) for e in args.env)}
+    criar_esquema(db_url, args.repo)
+    credenciais = semear(db_url, args.delegados, args.pautas)
+
+    with servidor(db_url, args.repo, env, args.workers, log=log) as base:
+        resultado = asyncio.run(executar(base, args, credenciais))
+
+    engine = create_engine(db_url)
+    with engine.connect() as conn: votos_no_banco = conn.execute(text("SELECT COUNT(*) FROM votos")).scalar()
+    engine.dispose()
+    locked = contar_locked(log)
+    try: commit = subprocess.run(["git", "-C", args.repo, "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError: commit = None
+
+    relatorio = {
+        "repo": os.path.abspath(args.repo), "commit": commit, "banco": db_url.split(":", 1)[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "database_url", "repo")},
+        **resultado,
+        "votos_no_banco": votos_no_banco,
+        "database_locked": {"ocorrencias": locked, "taxa": round(locked / resultado["total"]["requisicoes"], 5) if resultado["total"]["requisicoes"] else 0},
+        "log_servidor": log,
+    }
+    print(json.dumps(relatorio, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as f: json.dump(relatorio, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Escala dos endpoints administrativos e de relatório com o tamanho da base.
+
+Para cada tamanho em `--tamanhos` gera uma base sintética (gerar_dados.py),
+sobe o app e chama cada endpoint uma vez a frio e `--repeticoes` vezes a
+quente, medindo tempo, tamanho da resposta e o pico de memória do servidor
+durante a chamada (VmHWM de /proc, zerado antes de cada endpoint; só Linux).
+
+    python benchmarks/escala_admin.py
+    python benchmarks/escala_admin.py --tamanhos 1000,10000 --repo /tmp/checkout-antigo --saida antes.json
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comum import RAIZ, servidor, requisicao, percentis, criar_esquema, memoria_kb, zerar_pico
+from gerar_dados import gerar
+
+SENHA = "senha-do-benchmark"
+
+def endpoints(token_admin: str, credencial: str) -> dict:
+    h = {"x-admin-token": token_admin}
+    return {
+        "dados-admin": ("/api/dados-admin", h),
+        "grupos": ("/api/grupos", h),
+        "lista-para-email": ("/api/admin/lista-para-email", h),
+        "exportar-xlsx": (f"/api/exportar?formato=xlsx&token={token_admin}", None),
+        "exportar-csv": (f"/api/exportar?formato=csv&token={token_admin}", None),
+        "historico": (f"/api/historico?credencial={credencial}", None),
+        "telao-dados": ("/api/telao-dados", None),
+    }
+
+def medir(base: str, pid: int, url: str, headers: dict, repeticoes: int) -> dict:
+    rss = memoria_kb(pid)
+    pico_ok = zerar_pico(pid)
+    st, frio, corpo = requisicao("GET", base + url, headers=headers, timeout=600)
+    quentes = [requisicao("GET", base + url, headers=headers, timeout=600)[1] for _ in range(repeticoes)]
+    pico = memoria_kb(pid, "VmHWM") if pico_ok else None
+    return {
+        "status": st, "bytes": len(corpo), "frio_ms": round(frio * 1000, 1), "quente": percentis(quentes),
+        "rss_antes_mb": round(rss / 1024, 1) if rss else None,
+        "pico_acima_mb": round((pico - rss) / 1024, 1) if pico and rss else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tamanhos", default="1000,10000,100000", help="quantidades de delegados, separadas por vírgula")
+    ap.add_argument("--pautas", type=int, default=6)
+    ap.add_argument("--candidatos", type=int, default=30)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--so", help="mede só estes endpoints (separados por vírgula)")
+    ap.add_argument("--repo", default=RAIZ, help="checkout do app a medir")
+    ap.add_argument("--saida", help="grava o resultado em JSON")
+    args = ap.parse_args()
+
+    resultado = {"repo": os.path.abspath(args.repo), "pautas": args.pautas, "candidatos": args.candidatos, "tamanhos": {}}
+    for n in [int(x) for x in args.tamanhos.split(",")]:
+        pasta = tempfile.mkdtemp()
+        db_url = f"sqlite:///{os.path.join(pasta, 'bench.db')}"
+        criar_esquema(db_url, args.repo)
+        base_info = gerar(db_url, delegados=n, pautas=args.pautas, candidatos=args.candidatos)
+        print(f"{n} delegados: {base_info['votos']} votos gerados em {base_info['segundos']}s", file=sys.stderr)
+
+        with servidor(db_url, args.repo, {"ADMIN_PASSWORD": SENHA}, com_processo=True) as (base, proc):
+            st, _, corpo = requisicao("POST", base + "/api/admin/login", {"usuario": "admin", "senha": SENHA})
+            if st != 200: raise SystemExit(f"login do admin falhou: {st} {corpo!r}")
+            medidas = {}
+            for nome, (url, h) in endpoints(json.loads(corpo)["token"], base_info["tokens_exemplo"][0]).items():
+                if args.so and nome not in args.so.split(","): continue
+                medidas[nome] = medir(base, proc.pid, url, h, args.repeticoes)
+                print(f"  {nome}: {medidas[nome]['frio_ms']} ms a frio, pico +{medidas[nome]['pico_acima_mb']} MB", file=sys.stderr)
+        resultado["tamanhos"][str(n)] = {"votos": base_info["votos"], "endpoints": medidas}
+
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as f: json.dump(resultado, f, indent=2)
+
+if __name__ == "__main__":
+    main()
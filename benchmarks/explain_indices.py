@@ -0,0 +1,78 @@
+"""Confere por EXPLAIN que as consultas quentes usam os índices esperados.
+
+Cria o esquema com os models (e as migrações) do checkout, semeia uma base
+pequena (gerar_dados.py) e roda EXPLAIN em cada formato de consulta das
+rotas. Cada uma precisa citar o índice esperado no plano. Sai com código 1
+se alguma não usar. No PostgreSQL desliga o seq scan durante a checagem:
+com tabelas pequenas o planejador prefere varrer mesmo tendo o índice.
+
+    python benchmarks/explain_indices.py
+    python benchmarks/explain_indices.py --database-url postgresql://localhost/assembleia_explain
+"""
+import os
+import sys
+import argparse
+import tempfile
+from sqlalchemy import create_engine, select, func, text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comum import criar_esquema
+from gerar_dados import gerar
+
+def consultas() -> dict:
+    """nome -> (consulta, índice ou índices aceitos no plano)."""
+    from app import models
+    v, e, p, a, u, m = models.Voto, models.VotoEscolha, models.Pauta, models.Assembleia, models.Usuario, models.EnvioEmail
+    return {
+        "apuracao: votos da pauta": (select(v.usuario_id, v.escolha_str).where(v.pauta_id == "pauta-0-4"), "ux_votos_pauta_usuario"),
+        "votar: voto do delegado na pauta": (select(v.id).where(v.pauta_id == "pauta-0-4", v.usuario_id == "1-0"), "ux_votos_pauta_usuario"),
+        # Com a lista de pautas o SQLite pode ir pelo único (pauta_id, usuario_id): os dois servem
+        "historico: votos do delegado": (select(v.pauta_id, v.escolha_str).where(v.usuario_id == "1-0", v.pauta_id.in_(["pauta-0-0", "pauta-0-1"])),
+                                         ("ix_votos_usuario_pauta", "ux_votos_pauta_usuario")),
+        "apagar delegado: votos do delegado": (select(v.id).where(v.usuario_id == "1-0"), "ix_votos_usuario_pauta"),
+        "apuracao: contagem por escolha": (select(e.escolha, func.count()).where(e.pauta_id == "pauta-0-4").group_by(e.escolha), "ix_votos_escolhas_pauta_escolha"),
+        "estado: assembleia ativa": (select(a.id, a.titulo).where(a.ativa == True), "ix_assembleias_ativa"),
+        "estado: pautas da assembleia": (select(p.id).where(p.assembleia_id == "asm-0").order_by(p.seq, p.id), "ix_pautas_assembleia_seq"),
+        "startup/status: pautas abertas": (select(p.id).where(p.status == "ABERTA"), "ix_pautas_status_assembleia"),
+        "status: abertas da assembleia": (select(p.id).where(p.assembleia_id == "asm-0", p.status == "ABERTA"), "ix_pautas_"),
+        "delegados: membros do grupo": (select(u.id, u.nome).where(u.grupo == "7").order_by(u.seq), "ix_usuarios_grupo_seq"),
+        "login: delegado pelo token": (select(u.id).where(u.token == "000001"), "ix_usuarios_token"),
+        "cadastro: CPF repetido": (select(u.id).where(u.cpf_digits == "12345678909"), "ux_usuarios_cpf_digits"),
+        "email: fila pendente": (select(m.id).where(m.status == "PENDENTE").order_by(m.id), "ix_envios_email_status"),
+    }
+
+def plano(conn, consulta) -> str:
+    sql = str(consulta.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite": return "\n".join(r[-1] for r in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    return "\n".join(r[0] for r in conn.execute(text("EXPLAIN " + sql)))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--database-url", help="banco vazio (padrão: SQLite temporário)")
+    args = ap.parse_args()
+    db_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'explain.db')}"
+
+    os.environ["DATABASE_URL"] = db_url  # o import de app.models abre o engine do app
+    criar_esquema(db_url)
+    gerar(db_url, delegados=500, pautas=5)
+    engine = create_engine(db_url)
+    falhas = 0
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE"))
+            conn.execute(text("SET enable_seqscan = off"))
+        for nome, (consulta, indices) in consultas().items():
+            indices = (indices,) if isinstance(indices, str) else indices
+            p = plano(conn, consulta)
+            ok = any(i in p for i in indices)
+            falhas += not ok
+            print(f"{'ok   ' if ok else 'FALHA'} {nome} ({' ou '.join(indices)})")
+            if not ok: print("      " + p.replace("\n", "\n      "))
+        total = len(consultas())
+    engine.dispose()
+    print(f"{total - falhas}/{total} consultas usando o índice esperado")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
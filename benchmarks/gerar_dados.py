@@ -0,0 +1,125 @@
+"""Gera uma base sintética: assembleias, pautas, delegados e votos.
+
+Só a última assembleia fica ativa; nela a última pauta está ABERTA e as
+demais ENCERRADA (as das outras assembleias também). Uma pauta a cada
+`--cada-eleicao` é ELEICAO com `--candidatos` chapas. Cada delegado vota em
+cada pauta com probabilidade `--participacao`.
+
+Escreve por SQL simples, preenchendo as colunas/tabelas novas (cpf_digits,
+seq, pautas.seq, votos_escolhas) só quando existem, para servir também a checkouts
+antigos (`--repo`).
+
+    python benchmarks/gerar_dados.py --database-url sqlite:////tmp/grande.db --delegados 100000
+    python benchmarks/gerar_dados.py --database-url postgresql://localhost/assembleia_bench --pautas 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from sqlalchemy import create_engine, inspect, text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comum import RAIZ, criar_esquema, gerar_cpf
+
+LOTE = 5000
+
+def _inserir(conn, sql: str, linhas):
+    lote = []
+    for l in linhas:
+        lote.append(l)
+        if len(lote) >= LOTE: conn.execute(text(sql), lote); lote = []
+    if lote: conn.execute(text(sql), lote)
+
+def gerar(db_url: str, delegados: int = 1000, assembleias: int = 1, pautas: int = 5, candidatos: int = 20,
+          cada_eleicao: int = 3, participacao: float = 0.9, semente: int = 42) -> dict:
+    """Semeia um banco com o esquema já criado e vazio. Retorna contagens e alguns tokens."""
+    inicio = time.perf_counter()
+    rnd = random.Random(semente)
+    engine = create_engine(db_url)
+    insp = inspect(engine)
+    col_usuarios = {c["name"] for c in insp.get_columns("usuarios")}
+    com_escolhas = insp.has_table("votos_escolhas")
+    extras = [c for c in ("cpf_digits", "seq") if c in col_usuarios]
+    pauta_seq = "seq" in {c["name"] for c in insp.get_columns("pautas")}
+
+    lista_pautas = []
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM usuarios")).scalar(): raise SystemExit("o banco precisa estar vazio")
+        for a in range(assembleias):
+            ativa = a == assembleias - 1
+            conn.execute(text("INSERT INTO assembleias (id, titulo, ativa) VALUES (:id, :t, :a)"),
+                         {"id": f"asm-{a}", "t": f"Assembleia {a + 1}", "a": ativa})
+            for i in range(pautas):
+                eleicao = cada_eleicao > 0 and i % cada_eleicao == cada_eleicao - 1
+                p = {"id": f"pauta-{a}-{i}", "titulo": f"Pauta {i + 1}", "asm": f"asm-{a}",
+                     "status": "ABERTA" if ativa and i == pautas - 1 else "ENCERRADA",
+                     "tipo": "ELEICAO" if eleicao else "SIMPLES", "m": min(5, candidatos) if eleicao else 1,
+                     "c": json.dumps([f"Candidato {c + 1}" for c in range(candidatos)] if eleicao else []),
+                     "seq": len(lista_pautas) + 1}
+                conn.execute(text(
+                    "INSERT INTO pautas (id, titulo, assembleia_id, status, tipo, max_escolhas, candidatos_str" + (", seq" if pauta_seq else "") + ") "
+                    "VALUES (:id, :titulo, :asm, :status, :tipo, :m, :c" + (", :seq" if pauta_seq else "") + ")"), p)
+                lista_pautas.append(p)
+
+        grupos = max(1, delegados // 25)
+        ids = [f"{i % grupos + 1}-{i}" for i in range(delegados)]
+        cpfs = set()
+        def usuarios():
+            for i, uid in enumerate(ids):
+                cpf = gerar_cpf(rnd)
+                while cpf in cpfs: cpf = gerar_cpf(rnd)
+                cpfs.add(cpf)
+                u = {"id": uid, "token": f"{i:06X}", "nome": f"Delegado {i}", "grupo": uid.split("-")[0], "cpf": cpf,
+                     "email": f"delegado{i}@exemplo.org", "checkin": rnd.random() < 0.95}
+                if "cpf_digits" in extras: u["cpf_digits"] = cpf
+                if "seq" in extras: u["seq"] = i
+                yield u
+        cols = ["id", "token", "nome", "grupo", "cpf", "email", "checkin"] + extras
+        _inserir(conn, f"INSERT INTO usuarios ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)})", usuarios())
+
+        total_votos, total_escolhas, voto_id = 0, 0, 0
+        for p in lista_pautas:
+            cands = json.loads(p["c"])
+            votos, escolhas = [], []
+            for uid in ids:
+                if rnd.random() >= participacao: continue
+                voto_id += 1
+                valor = rnd.sample(cands, rnd.randint(1, p["m"])) if p["tipo"] == "ELEICAO" else rnd.choice(["favor", "contra", "abstencao"])
+                votos.append({"id": voto_id, "p": p["id"], "u": uid, "e": json.dumps(valor)})
+                if com_escolhas:
+                    for pos, v in enumerate(valor if isinstance(valor, list) else [valor]):
+                        escolhas.append({"v": voto_id, "pos": pos, "p": p["id"], "e": v})
+            _inserir(conn, "INSERT INTO votos (id, pauta_id, usuario_id, escolha_str) VALUES (:id, :p, :u, :e)", votos)
+            if escolhas: _inserir(conn, "INSERT INTO votos_escolhas (voto_id, posicao, pauta_id, escolha) VALUES (:v, :pos, :p, :e)", escolhas)
+            total_votos += len(votos); total_escolhas += len(escolhas)
+        # ids explícitos: no PostgreSQL a sequência precisa andar junto
+        if engine.dialect.name == "postgresql" and voto_id:
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('votos', 'id'), :m)"), {"m": voto_id})
+    engine.dispose()
+    return {
+        "assembleias": assembleias, "pautas": len(lista_pautas), "delegados": delegados, "votos": total_votos,
+        "escolhas": total_escolhas, "segundos": round(time.perf_counter() - inicio, 1),
+        "tokens_exemplo": [f"{i:06X}" for i in range(min(delegados, 5))],
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--database-url", required=True, help="banco vazio (as tabelas são criadas subindo o app uma vez)")
+    ap.add_argument("--delegados", type=int, default=1000)
+    ap.add_argument("--assembleias", type=int, default=1)
+    ap.add_argument("--pautas", type=int, default=5, help="pautas por assembleia")
+    ap.add_argument("--candidatos", type=int, default=20, help="chapas/candidatos nas pautas ELEICAO")
+    ap.add_argument("--cada-eleicao", type=int, default=3, help="uma pauta ELEICAO a cada N (0 = nenhuma)")
+    ap.add_argument("--participacao", type=float, default=0.9, help="fração dos delegados que vota em cada pauta")
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--repo", default=RAIZ, help="checkout cujo esquema será criado")
+    args = ap.parse_args()
+
+    criar_esquema(args.database_url, args.repo)
+    print(json.dumps(gerar(args.database_url, args.delegados, args.assembleias, args.pautas, args.candidatos,
+                           args.cada_eleicao, args.participacao, args.semente), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Logins de admin durante a votação: p99 dos delegados com e sem logins.
+
+Os delegados ficam em laço chamando /api/pauta-ativa e /api/heartbeat. Na
+primeira fase só eles; na segunda, `--admins` clientes fazem login em laço
+(metade como "admin", metade como um admin secundário). Mede logins/s e a
+latência dos delegados nas duas fases.
+
+    python benchmarks/login_admin.py
+    python benchmarks/login_admin.py --repo /tmp/checkout-antigo
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comum import RAIZ, servidor, requisicao, percentis, criar_esquema, semear_votacao
+
+SENHA = "senha-do-benchmark"
+
+def _em_laco(fim: float, acao, amostras: list, lock):
+    while time.perf_counter() < fim:
+        st, dt = acao()
+        with lock: amostras.append((st, dt))
+
+def _fase(base: str, tokens: list, delegados: int, admins: int, segundos: float):
+    lock = threading.Lock()
+    deleg, logins = [], []
+    fim = time.perf_counter() + segundos
+
+    def delegado(i):
+        t = tokens[i % len(tokens)]
+        alterna = [0]
+        def acao():
+            alterna[0] ^= 1
+            if alterna[0]: st, dt, _ = requisicao("GET", f"{base}/api/pauta-ativa?credencial={t}")
+            else: st, dt, _ = requisicao("POST", base + "/api/heartbeat", {"token": t})
+            return st, dt
+        _em_laco(fim, acao, deleg, lock)
+
+    def admin(i):
+        corpo = {"usuario": "admin", "senha": SENHA} if i % 2 == 0 else {"usuario": "bench", "senha": SENHA}
+        def acao():
+            st, dt, _ = requisicao("POST", base + "/api/admin/login", corpo)
+            return st, dt
+        _em_laco(fim, acao, logins, lock)
+
+    threads = [threading.Thread(target=delegado, args=(i,)) for i in range(delegados)]
+    threads += [threading.Thread(target=admin, args=(i,)) for i in range(admins)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    erros = lambda xs: sum(1 for st, _ in xs if st != 200)
+    return {
+        "delegados": percentis([dt for _, dt in deleg]), "delegados_erros": erros(deleg),
+        "logins": percentis([dt for _, dt in logins]), "logins_erros": erros(logins),
+        "logins_por_s": round(len(logins) / segundos, 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--delegados", type=int, default=32, help="clientes de delegado simultâneos")
+    ap.add_argument("--admins", type=int, default=8, help="clientes fazendo login de admin em laço")
+    ap.add_argument("--segundos", type=float, default=10)
+    ap.add_argument("--repo", default=RAIZ, help="checkout do app a medir")
+    ap.add_argument("--saida", help="grava o resultado em JSON")
+    args = ap.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    db_url = f"sqlite:///{os.path.join(pasta, 'bench.db')}"
+    criar_esquema(db_url, args.repo)
+    _, tokens = semear_votacao(db_url, max(args.delegados, 100))
+
+    with servidor(db_url, args.repo, {"ADMIN_PASSWORD": SENHA}) as base:
+        st, _, corpo = requisicao("POST", base + "/api/admin/login", {"usuario": "admin", "senha": SENHA})
+        if st != 200: raise SystemExit(f"login do admin falhou: {st} {corpo!r}")
+        token = json.loads(corpo)["token"]
+        requisicao("POST", base + "/api/admins", {"usuario": "bench", "senha": SENHA}, {"x-admin-token": token})
+
+        so_delegados = _fase(base, tokens, args.delegados, 0, args.segundos)
+        com_logins = _fase(base, tokens, args.delegados, args.admins, args.segundos)
+
+    resultado = {
+        "repo": os.path.abspath(args.repo), "delegados": args.delegados, "admins": args.admins, "segundos": args.segundos,
+        "so_delegados": so_delegados, "com_logins": com_logins,
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as f: json.dump(resultado, f, indent=2)
+
+if __name__ == "__main__":
+    main()
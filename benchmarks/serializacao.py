@@ -0,0 +1,98 @@
+"""Serialização e compressão do payload do painel admin.
+
+Para cada total de votos em `--votos` gera uma base sintética, sobe o app e
+baixa /api/dados-admin, /api/votos-detalhados (o detalhe completo, que antes
+vinha dentro do dados-admin), /api/grupos e /api/delegados. Com o conteúdo
+em mãos mede, no próprio processo, o tempo de serialização pelo caminho
+padrão do FastAPI (jsonable_encoder + json), pelo json compacto e pelo
+orjson, e o tamanho/tempo do gzip em alguns níveis. Do servidor mede os
+bytes que trafegam com e sem Accept-Encoding: gzip.
+
+    python benchmarks/serializacao.py
+    python benchmarks/serializacao.py --votos 1000,10000,100000 --saida serializacao.json
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comum import servidor, requisicao, criar_esquema
+from gerar_dados import gerar
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.respostas import dumps, orjson
+
+SENHA = "senha-do-benchmark"
+PAUTAS = 5
+
+def _cronometrar(fn, repeticoes: int):
+    melhor = None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        res = fn()
+        dt = time.perf_counter() - t0
+        melhor = dt if melhor is None else min(melhor, dt)
+    return res, round(melhor * 1000, 2)
+
+def serializadores(dados, repeticoes: int) -> dict:
+    res = {}
+    corpo, ms = _cronometrar(lambda: JSONResponse(jsonable_encoder(dados)).body, repeticoes)
+    res["fastapi_padrao"] = {"ms": ms, "bytes": len(corpo)}
+    corpo, ms = _cronometrar(lambda: json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode(), repeticoes)
+    res["json_compacto"] = {"ms": ms, "bytes": len(corpo)}
+    if orjson:
+        corpo, ms = _cronometrar(lambda: dumps(dados), repeticoes)
+        res["orjson"] = {"ms": ms, "bytes": len(corpo)}
+    for nivel in (1, 6, 9):
+        z, ms = _cronometrar(lambda: gzip.compress(corpo, compresslevel=nivel), repeticoes)
+        res[f"gzip_{nivel}"] = {"ms": ms, "bytes": len(z)}
+    return res
+
+def no_fio(base: str, url: str, headers: dict) -> dict:
+    res = {}
+    for nome, enc in (("identity", "identity"), ("gzip", "gzip")):
+        st, dt, corpo = requisicao("GET", base + url, headers={**headers, "Accept-Encoding": enc})
+        if st != 200: raise SystemExit(f"{url}: {st} {corpo[:200]!r}")
+        res[nome] = {"bytes": len(corpo), "ms": round(dt * 1000, 1)}
+    return res
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--votos", default="1000,10000", help="totais de votos, separados por vírgula")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--saida", help="grava o resultado em JSON")
+    args = ap.parse_args()
+
+    resultado = {"orjson": orjson.__version__ if orjson else None, "tamanhos": {}}
+    for votos in [int(x) for x in args.votos.split(",")]:
+        pasta = tempfile.mkdtemp()
+        db_url = f"sqlite:///{os.path.join(pasta, 'bench.db')}"
+        criar_esquema(db_url)
+        info = gerar(db_url, delegados=max(1, votos // PAUTAS), pautas=PAUTAS, participacao=1.0)
+        print(f"{votos} votos pedidos: {info['votos']} gerados", file=sys.stderr)
+
+        medidas = {}
+        with servidor(db_url, env_extra={"ADMIN_PASSWORD": SENHA}) as base:
+            st, _, corpo = requisicao("POST", base + "/api/admin/login", {"usuario": "admin", "senha": SENHA})
+            if st != 200: raise SystemExit(f"login do admin falhou: {st} {corpo!r}")
+            h = {"x-admin-token": json.loads(corpo)["token"]}
+            for nome, url in (("dados-admin", "/api/dados-admin"), ("votos-detalhados", "/api/votos-detalhados?limite=20000"),
+                              ("grupos", "/api/grupos"), ("delegados", "/api/delegados")):
+                st, _, corpo = requisicao("GET", base + url, headers={**h, "Accept-Encoding": "identity"})
+                medidas[nome] = {"serializacao": serializadores(json.loads(corpo), args.repeticoes), "fio": no_fio(base, url, h)}
+                s = medidas[nome]["serializacao"]
+                print(f"  {nome}: padrão {s['fastapi_padrao']['ms']} ms, orjson {s.get('orjson', {}).get('ms')} ms, "
+                      f"{s['fastapi_padrao']['bytes']} -> {medidas[nome]['fio']['gzip']['bytes']} bytes", file=sys.stderr)
+        resultado["tamanhos"][str(votos)] = {"votos": info["votos"], "payloads": medidas}
+
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as f: json.dump(resultado, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,15 @@
-import asyncio
 import os
+import time
+import queue
 import smtplib
 import ssl
+import argparse
+import threading
+from datetime import datetime
 from pathlib import Path
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.models import Usuario
-from app.database import Base
 
 # ==============================================================================
 # 1. CARREGAMENTO ROBUSTO DO ARQUIVO .ENV
@@ -28,38 +28,26 @@ else:
     print("✅ ARQUIVO .ENV CARREGADO COM SUCESSO!")
 print("-" * 50)
 
+# O app lê DATABASE_URL ao ser importado: só depois do .env
+from sqlalchemy import select, func, bindparam
+from app import models
+from app.database import engine
+
 # ==============================================================================
-# 2. CONFIGURAÇÕES E BANCO DE DADOS
+# 2. CONFIGURAÇÕES
 # ==============================================================================
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-if not DATABASE_URL:
-    print("⚠️  AVISO: DATABASE_URL vazia. Usando SQLite temporário.")
-    DATABASE_URL = "sqlite:///./sql_app.db"
-elif "postgres" in DATABASE_URL:
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
-db = SessionLocal()
-Base.metadata.create_all(bind=engine)
-
-ARQUIVO_MEMORIA = pasta_do_script / "emails_ja_enviados.txt"
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
 
-def carregar_enviados():
-    if not ARQUIVO_MEMORIA.exists(): return set()
-    with open(ARQUIVO_MEMORIA, "r") as f: return set(l.strip() for l in f.readlines())
-
-def salvar_envio(email):
-    with open(ARQUIVO_MEMORIA, "a") as f: f.write(f"{email}\n")
+TIPO = "credencial"
+ARQUIVO_MEMORIA = pasta_do_script / "emails_ja_enviados.txt"  # controle antigo, importado para a fila
 
 # ==============================================================================
 # 3. TEMPLATE DE E-MAIL (SEMINÁRIO REGIONAL 2026)
 # ==============================================================================
-def enviar_email_direto(destinatario, nome, token, user_id, grupo):
+def montar_email(destinatario, nome, token, user_id, grupo):
     # Cores: Azul Escoteiro (#002d62) e Fundo Cinza (#f3f4f6)
     html = f"""
     <!DOCTYPE html>
@@ -149,67 +137,250 @@ def enviar_email_direto(destinatario, nome, token, user_id, grupo):
     msg['To'] = destinatario
     msg['Subject'] = "🎟️ Credencial - Assembleia Ordinária Regional 2026"
     msg.attach(MIMEText(html, 'html'))
+    return msg
+
+# ==============================================================================
+# 4. FILA DE SAÍDA NO BANCO (envios_email)
+# ==============================================================================
+# Cada delegado com e-mail vira um registro PENDENTE. O estado é gravado logo
+# após cada tentativa, então uma execução interrompida retoma de onde parou.
+
+def email_valido(email) -> bool:
+    return bool(email) and "@" in email and "sem_email" not in email
+
+def enfileirar(lote_tamanho: int) -> int:
+    """Cria os registros PENDENTE que faltam, lendo os delegados em blocos."""
+    ja_enviados = set()
+    if ARQUIVO_MEMORIA.exists():
+        with open(ARQUIVO_MEMORIA, "r") as f: ja_enviados = set(l.strip() for l in f if l.strip())
+    u, e = models.Usuario, models.EnvioEmail
+    novos, ultimo_id = 0, ""
+    while True:
+        with engine.begin() as conn:
+            bloco = conn.execute(select(u.id, u.email).where(u.id > ultimo_id).order_by(u.id).limit(lote_tamanho)).all()
+            if not bloco: break
+            ultimo_id = bloco[-1].id
+            ids = [r.id for r in bloco]
+            existentes = set(conn.execute(select(e.usuario_id).where(e.usuario_id.in_(ids), e.tipo == TIPO)).scalars())
+            agora = datetime.utcnow()
+            linhas = [{
+                "usuario_id": r.id, "tipo": TIPO, "destinatario": r.email, "tentativas": 0, "atualizado_em": agora,
+                "status": "ENVIADO" if r.email in ja_enviados else "PENDENTE",
+                "enviado_em": agora if r.email in ja_enviados else None,
+            } for r in bloco if r.id not in existentes and email_valido(r.email)]
+            if linhas: conn.execute(e.__table__.insert(), linhas)
+            novos += len(linhas)
+    return novos
+
+def proximos(ultimo_id: int, lote_tamanho: int, reenviar_falhas: bool) -> list:
+    """Próximo bloco a enviar, com os dados do delegado (paginação por id)."""
+    u, e = models.Usuario, models.EnvioEmail
+    status = ["PENDENTE", "FALHOU"] if reenviar_falhas else ["PENDENTE"]
+    with engine.connect() as conn:
+        return conn.execute(
+            select(e.id, e.destinatario, e.tentativas, u.nome, u.token, u.id.label("uid"), u.grupo)
+            .join(u, u.id == e.usuario_id)
+            .where(e.tipo == TIPO, e.status.in_(status), e.id > ultimo_id).order_by(e.id).limit(lote_tamanho)
+        ).all()
+
+_ATUALIZAR = models.EnvioEmail.__table__.update()\
+    .where(models.EnvioEmail.__table__.c.id == bindparam("b_id"))\
+    .values(status=bindparam("b_status"), tentativas=bindparam("b_tentativas"), ultimo_erro=bindparam("b_erro"),
+            atualizado_em=bindparam("b_quando"), enviado_em=bindparam("b_enviado"))
+
+def gravar_resultados(resultados: list):
+    if not resultados: return
+    with engine.begin() as conn: conn.execute(_ATUALIZAR, resultados)
+
+def contar() -> dict:
+    e = models.EnvioEmail
+    with engine.connect() as conn:
+        return dict(conn.execute(select(e.status, func.count(e.id)).where(e.tipo == TIPO).group_by(e.status)).all())
+
+# ==============================================================================
+# 5. CONEXÕES SMTP REAPROVEITADAS E LIMITE DE VAZÃO
+# ==============================================================================
+class Limitador:
+    """Espaça os envios (de todas as threads) em no máximo `por_minuto` mensagens por minuto."""
+    def __init__(self, por_minuto: float):
+        self.intervalo = 60.0 / por_minuto if por_minuto > 0 else 0
+        self.proximo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo: return
+        with self.lock:
+            agora = time.monotonic()
+            vez = max(agora, self.proximo)
+            self.proximo = vez + self.intervalo
+        if vez > agora: time.sleep(vez - agora)
+
+class ConexaoSMTP:
+    """Uma sessão SMTP autenticada usada para várias mensagens (reabre se cair)."""
+    def __init__(self, args):
+        self.args = args
+        self.smtp = None
+        self.enviadas = 0
 
-    context = ssl.create_default_context()
-    context.check_hostname = False
-    context.verify_mode = ssl.CERT_NONE
+    def abrir(self):
+        self.fechar()
+        a = self.args
+        s = smtplib.SMTP(a.servidor, a.porta, timeout=30)
+        s.ehlo()
+        if not a.sem_tls:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            s.starttls(context=context)
+            s.ehlo()
+        if not a.sem_login: s.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self.smtp, self.enviadas = s, 0
+
+    def enviar(self, destinatario: str, msg):
+        if self.smtp is None or self.enviadas >= self.args.por_conexao: self.abrir()
+        try: self.smtp.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self.abrir()
+            self.smtp.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
+        self.enviadas += 1
+
+    def fechar(self):
+        if self.smtp is None: return
+        try: self.smtp.quit()
+        except Exception: pass
+        self.smtp = None
+
+def remetente(args, trabalho: queue.Queue, resultados: queue.Queue, limitador: Limitador, abortar: threading.Event):
+    conexao = ConexaoSMTP(args)
+    try:
+        while True:
+            item = trabalho.get()
+            if item is None or abortar.is_set(): return
+            tentativas = item.tentativas + 1
+            limitador.aguardar()
+            try:
+                conexao.enviar(item.destinatario, montar_email(item.destinatario, item.nome, item.token, item.uid, item.grupo or "ND"))
+                resultados.put({"b_id": item.id, "b_status": "ENVIADO", "b_tentativas": tentativas, "b_erro": None,
+                                "b_quando": datetime.utcnow(), "b_enviado": datetime.utcnow()})
+                print(f"✅ {item.nome} ({item.destinatario})")
+            except smtplib.SMTPAuthenticationError:
+                print("❌ ERRO CRÍTICO: Login ou Senha do e-mail incorretos.")
+                abortar.set()
+                return
+            except Exception as e:
+                # Recusa do servidor (4xx/5xx) não derruba a sessão; erro de rede sim
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)): conexao.fechar()
+                status = "FALHOU" if tentativas >= args.max_tentativas else "PENDENTE"
+                resultados.put({"b_id": item.id, "b_status": status, "b_tentativas": tentativas, "b_erro": str(e)[:500],
+                                "b_quando": datetime.utcnow(), "b_enviado": None})
+                print(f"❌ {item.destinatario}: {e}")
+    finally:
+        conexao.fechar()
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.ehlo()
-        server.starttls(context=context)
-        server.ehlo()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD) 
-        server.sendmail(MAIL_USERNAME, destinatario, msg.as_string())
+def _drenar(resultados: queue.Queue) -> list:
+    lote = []
+    while True:
+        try: lote.append(resultados.get_nowait())
+        except queue.Empty: return lote
 
 # ==============================================================================
-# 4. LOOP DE DISPARO
+# 6. DISPARO
 # ==============================================================================
-async def disparar():
-    if not MAIL_USERNAME or not MAIL_PASSWORD:
+def disparar(args) -> dict:
+    if not args.sem_login and (not MAIL_USERNAME or not MAIL_PASSWORD):
         print("\n⛔ PAUSANDO: As credenciais de e-mail não foram carregadas do .env")
-        return
+        return {}
 
     print("\n--- INICIANDO DISPARADOR (Seminário 2026) ---")
-    try:
-        usuarios = db.query(Usuario).all()
-    except Exception as e:
-        print(f"❌ Erro ao conectar no Banco de Dados: {e}")
-        return
-
-    ja_enviados = carregar_enviados()
-    print(f"👥 Total no Banco: {len(usuarios)}")
-    print(f"📩 Já enviados: {len(ja_enviados)}")
+    models.Base.metadata.create_all(bind=engine)
+    print(f"📥 Novos na fila: {enfileirar(args.lote)}")
+    print(f"📊 Situação: {contar()}")
+    print(f"🚀 {args.conexoes} conexões, até {args.por_minuto:g} e-mails/min")
     print("-" * 40)
 
-    contagem = 0
+    trabalho = queue.Queue(maxsize=args.conexoes * 2)
+    resultados = queue.Queue()
+    abortar = threading.Event()
+    limitador = Limitador(args.por_minuto)
+    threads = [threading.Thread(target=remetente, args=(args, trabalho, resultados, limitador, abortar), daemon=True)
+               for _ in range(args.conexoes)]
+    for t in threads: t.start()
 
-    for user in usuarios:
-        if not user.email or "@" not in user.email or "sem_email" in user.email:
-            continue
-        if user.email in ja_enviados:
-            continue
+    # Cada passada percorre a fila uma vez por id. Quem falhou abaixo de
+    # --max-tentativas continua PENDENTE e volta numa nova passada, até não
+    # sobrar falha temporária (no máximo --max-tentativas passadas)
+    inicio, passada = time.monotonic(), 1
+    postos = recebidos = repetir = 0
 
-        print(f"🚀 ENVIANDO PARA: {user.nome} ({user.email})...")
-        
-        try:
-            grupo_txt = getattr(user, 'grupo', 'ND')
-            enviar_email_direto(user.email, user.nome, user.token, user.id, grupo_txt)
-            
-            print(f"✅ SUCESSO!")
-            salvar_envio(user.email)
-            ja_enviados.add(user.email)
-            contagem += 1
-            
-            await asyncio.sleep(2) 
-            
-        except smtplib.SMTPAuthenticationError:
-            print("❌ ERRO CRÍTICO: Login ou Senha do Gmail incorretos.")
-            break 
-        except Exception as e:
-            print(f"❌ ERRO: {e}")
+    def gravar():
+        nonlocal recebidos, repetir
+        lote = _drenar(resultados)
+        gravar_resultados(lote)
+        recebidos += len(lote)
+        repetir += sum(r["b_status"] == "PENDENTE" for r in lote)
 
+    try:
+        while not abortar.is_set():
+            postos = recebidos = repetir = 0
+            ultimo_id = 0
+            while not abortar.is_set():
+                bloco = proximos(ultimo_id, args.lote, args.reenviar_falhas and passada == 1)
+                if not bloco: break
+                ultimo_id = bloco[-1].id
+                for item in bloco:
+                    while not abortar.is_set():
+                        try:
+                            trabalho.put(item, timeout=1)
+                            postos += 1
+                            break
+                        except queue.Full:
+                            gravar()
+                    gravar()
+            # A próxima passada só começa com o resultado de todos os envios desta
+            while recebidos < postos and not abortar.is_set():
+                time.sleep(0.2)
+                gravar()
+            if not repetir or abortar.is_set(): break
+            passada += 1
+            print(f"🔁 {repetir} falha(s) temporária(s): passada {passada} em {args.espera:g}s")
+            abortar.wait(args.espera)
+    except KeyboardInterrupt:
+        # Descarta o que não começou; os envios em andamento terminam e são gravados
+        print("\n⏸️ Interrompido: gravando o que já foi enviado...")
+        abortar.set()
+    # Abortado (Ctrl-C ou login recusado): o que não começou fica PENDENTE no banco.
+    # Remetente que já saiu não consome o aviso de parada, então a fila cheia não pode travar
+    if abortar.is_set(): _drenar(trabalho)
+    for t in threads:
+        while t.is_alive():
+            try:
+                trabalho.put(None, timeout=1)
+                break
+            except queue.Full:
+                if abortar.is_set(): _drenar(trabalho)
+    for t in threads: t.join()
+    gravar_resultados(_drenar(resultados))
+
+    situacao = contar()
     print("-" * 40)
-    print(f"🏁 Finalizado. Novos e-mails enviados: {contagem}")
+    print(f"🏁 Finalizado em {time.monotonic() - inicio:.1f}s ({passada} passada(s)). Situação: {situacao}")
+    if situacao.get("PENDENTE"): print("ℹ️ Ainda há PENDENTE (execução interrompida): rode de novo para retomar.")
+    return situacao
+
+def main():
+    ap = argparse.ArgumentParser(description="Envia as credenciais por e-mail a partir da fila envios_email.")
+    ap.add_argument("--conexoes", type=int, default=int(os.getenv("DISPARO_CONEXOES", 3)), help="remetentes simultâneos (uma conexão SMTP cada)")
+    ap.add_argument("--por-minuto", type=float, default=float(os.getenv("DISPARO_POR_MINUTO", 60)), help="limite total de e-mails por minuto (0 = sem limite)")
+    ap.add_argument("--por-conexao", type=int, default=100, help="mensagens antes de reabrir a conexão SMTP")
+    ap.add_argument("--lote", type=int, default=500, help="registros lidos do banco por vez")
+    ap.add_argument("--max-tentativas", type=int, default=3, help="tentativas por e-mail; as que falham voltam em novas passadas nesta execução")
+    ap.add_argument("--espera", type=float, default=10, help="segundos entre uma passada e a próxima")
+    ap.add_argument("--reenviar-falhas", action="store_true", help="tenta de novo os registros FALHOU")
+    ap.add_argument("--servidor", default=MAIL_SERVER)
+    ap.add_argument("--porta", type=int, default=MAIL_PORT)
+    ap.add_argument("--sem-tls", action="store_true", help="não usa STARTTLS (ex.: aiosmtpd local)")
+    ap.add_argument("--sem-login", action="store_true", help="não autentica (ex.: aiosmtpd local)")
+    disparar(ap.parse_args())
 
 if __name__ == "__main__":
-    asyncio.run(disparar())
\ No newline at end of file
+    main()